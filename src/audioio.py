@@ -0,0 +1,68 @@
+#! /usr/bin/python3
+#
+#  WAV FILE UTILITIES
+#
+# The recordings in "audiofiles/" are mono 24 bit PCM WAV files at 48kHz.
+# These functions read them as float32 arrays in [-1,1) using only the "wave"
+# module of the standard library and numpy.
+
+import numpy as np
+import wave
+
+## Convert raw little-endian PCM frames to float32 samples
+#
+#  @param frames    : Raw bytes read from the WAV file
+#  @param sampwidth : Bytes per sample (1,2,3 or 4)
+#  @param nchannels : Number of interleaved channels (they are averaged)
+#
+#  @return A float32 numpy array (mono)
+#
+def pcm_to_float(frames, sampwidth, nchannels=1):
+    if sampwidth == 1:      # 8 bit WAV files are unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+        padded[:, 1:] = raw  # Left align the 24 bits in a 32 bit integer
+        samples = padded.view("<i4").reshape(-1).astype(np.float32) / 2147483648.0
+    elif sampwidth == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise Exception("Unsupported sample width ("+str(sampwidth)+" bytes)")
+    if nchannels > 1:
+        samples = samples.reshape(-1, nchannels).mean(axis=1, dtype=np.float32)
+    return samples
+
+## Read a whole WAV file
+#
+#  @return A tuple (float32 mono samples, samplerate)
+#
+def read_wav(path):
+    with wave.open(path, "rb") as wavfile:
+        frames = wavfile.readframes(wavfile.getnframes())
+        return pcm_to_float(frames, wavfile.getsampwidth(), wavfile.getnchannels()), wavfile.getframerate()
+
+## Read a WAV file in fixed-size blocks
+#  Only one block at a time is kept in memory, regardless of the file length.
+#
+#  @param path       : Path of the WAV file
+#  @param block_size : Samples per block (the last block can be shorter)
+#
+#  @return A generator of float32 mono blocks
+#
+def read_wav_blocks(path, block_size):
+    with wave.open(path, "rb") as wavfile:
+        sampwidth = wavfile.getsampwidth()
+        nchannels = wavfile.getnchannels()
+        while True:
+            frames = wavfile.readframes(block_size)
+            if len(frames) == 0:
+                break
+            yield pcm_to_float(frames, sampwidth, nchannels)
+
+## Samplerate of a WAV file
+def wav_samplerate(path):
+    with wave.open(path, "rb") as wavfile:
+        return wavfile.getframerate()
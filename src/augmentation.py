@@ -0,0 +1,172 @@
+#! /usr/bin/python3
+#
+#  ON-THE-FLY AUDIO AUGMENTATION FOR ROBUSTNESS SCORING
+#
+# The highpass and compressed variants of the dataset
+# ("audiofiles/HighpassRecordings", "audiofiles/CompressRecordings") were
+# rendered offline, each one a full copy of the dataset on disk.
+# This module generates variants in memory from the recordings cached by
+# "dataset.py" and scores a configuration against K of them in one call,
+# reporting mean and worst-case f1-score. No WAV file is written.
+#
+# All the recordings are processed together as a zero-padded 2D batch
+# (recordings x samples), with vectorized filtering along the time axis.
+# Padding does not change the result since all the processing is causal.
+#
+# An augmentation is a dict with a "type" and its parameters:
+#   {"type":"gain",       "gain_db":-12}
+#   {"type":"noise",      "snr_db":20}                      (white noise)
+#   {"type":"highpass",   "cutoff_hz":2000, "order":2, "mix":0.2}
+#   {"type":"lowpass",    "cutoff_hz":4000, "order":2, "replace":True}
+#   {"type":"gate",       "threshold_db":-50, "time_ms":5}
+#   {"type":"compressor", "threshold_db":-20, "ratio":6, "time_ms":5, "makeup_db":0}
+# A list of dicts is applied as a chain.
+# Filters add "mix" times the filtered signal to the original one (default
+# 1.0), like the offline "highpass-sum" variants, or replace the original
+# signal with the filtered one if "replace" is True ("mix" is not allowed then).
+#
+# Usage: augmentation.py <results_file> [--audio-directory D]
+#                        [--labels-directory L]
+
+import argparse
+import chunkedevaluation
+import dataset
+import numpy as np
+import onsetdetector
+import scipy.signal
+
+# Variants similar to the ones rendered offline, plus gain and noise
+DEFAULT_AUGMENTATIONS = [
+    {"type":"gain", "gain_db":-12},
+    {"type":"gain", "gain_db":6},
+    {"type":"noise", "snr_db":30},
+    {"type":"noise", "snr_db":20},
+    {"type":"highpass", "cutoff_hz":2000, "order":2, "mix":0.2},
+    {"type":"lowpass", "cutoff_hz":4000, "order":2, "replace":True},
+    {"type":"gate", "threshold_db":-50, "time_ms":5},
+    [{"type":"gate", "threshold_db":-36, "time_ms":5}, {"type":"compressor", "threshold_db":-20, "ratio":6, "time_ms":5}],
+]
+
+## Stack recordings in a zero-padded 2D batch
+#
+#  @return The batch (float32, recordings x samples) and the lengths
+#
+def make_batch(recordings):
+    lengths = np.array([len(r.samples) for r in recordings])
+    batch = np.zeros((len(recordings), lengths.max()), dtype=np.float32)
+    for i, recording in enumerate(recordings):
+        batch[i, :lengths[i]] = recording.samples
+    return batch, lengths
+
+## Mask of the valid (non padding) samples of a batch
+def valid_mask(batch, lengths):
+    return np.arange(batch.shape[1])[np.newaxis, :] < lengths[:, np.newaxis]
+
+## Smoothed amplitude envelope (dB) of each row, one-pole filter on |x|
+def envelope_db(batch, samplerate, time_ms):
+    coefficient = np.exp(-1.0/(samplerate*time_ms/1000.0))
+    envelope = scipy.signal.lfilter([1.0-coefficient], [1.0, -coefficient], np.abs(batch), axis=1)
+    return 20.0*np.log10(np.maximum(envelope, 1e-10))
+
+## Apply an augmentation (or a chain of them) to a batch
+#
+#  @param batch        : 2D float32 array (recordings x samples)
+#  @param lengths      : Length of each recording (samples)
+#  @param samplerate   : Samplerate (Hz)
+#  @param augmentation : Augmentation dict or list of dicts
+#  @param rng          : numpy random Generator (for noise)
+#
+#  @return A new 2D float32 array
+#
+def apply_augmentation(batch, lengths, samplerate, augmentation, rng):
+    if isinstance(augmentation, list):
+        for step in augmentation:
+            batch = apply_augmentation(batch, lengths, samplerate, step, rng)
+        return batch
+
+    kind = augmentation["type"]
+    if kind == "gain":
+        result = batch * np.float32(10.0**(augmentation["gain_db"]/20.0))
+    elif kind == "noise":
+        mask = valid_mask(batch, lengths)
+        power = (batch.astype(np.float64)**2).sum(axis=1) / lengths
+        noise_std = np.sqrt(power / 10.0**(augmentation["snr_db"]/10.0))
+        noise = rng.standard_normal(batch.shape, dtype=np.float32) * noise_std[:, np.newaxis].astype(np.float32)
+        result = batch + noise*mask
+    elif kind in ["highpass", "lowpass"]:
+        sos = scipy.signal.butter(augmentation.get("order", 2), augmentation["cutoff_hz"], btype=kind, fs=samplerate, output="sos")
+        filtered = scipy.signal.sosfilt(sos, batch, axis=1)
+        if augmentation.get("replace", False):
+            if "mix" in augmentation:
+                raise Exception("\"mix\" and \"replace\" can't be used together ("+describe(augmentation)+")")
+            result = filtered
+        else:
+            result = batch + augmentation.get("mix", 1.0)*filtered
+    elif kind == "gate":
+        env = envelope_db(batch, samplerate, augmentation.get("time_ms", 5))
+        result = np.where(env < augmentation["threshold_db"], 0.0, batch)
+    elif kind == "compressor":
+        env = envelope_db(batch, samplerate, augmentation.get("time_ms", 5))
+        over = np.maximum(env - augmentation["threshold_db"], 0.0)
+        gain_db = -over*(1.0 - 1.0/augmentation["ratio"]) + augmentation.get("makeup_db", 0.0)
+        result = batch * 10.0**(gain_db/20.0)
+    else:
+        raise Exception("Unknown augmentation type \""+kind+"\"")
+    return result.astype(np.float32)
+
+## Human readable name of an augmentation
+def describe(augmentation):
+    if isinstance(augmentation, list):
+        return "+".join(describe(step) for step in augmentation)
+    parameters = ",".join(key+"="+str(value) for key, value in augmentation.items() if key != "type")
+    return augmentation["type"]+"("+parameters+")"
+
+## Score a configuration against K augmentations of the dataset
+#
+#  @param configuration : Dict of parameters (see onsetdetector.read_configuration)
+#  @param augmentations : List of K augmentations
+#  @param recordings    : Recordings to augment (default: dataset.load_dataset())
+#  @param seed          : Seed for the noise generator
+#  @param metric        : f1-score used ("macroavg_tech_metrics" as the optimizer,
+#                         or "glob_metrics")
+#
+#  @return A dict with the f1-score for each augmentation, their mean and the
+#          worst case
+#
+def score_configuration(configuration, augmentations=DEFAULT_AUGMENTATIONS, recordings=None, seed=0, metric="macroavg_tech_metrics"):
+    if recordings is None:
+        recordings = dataset.load_dataset()
+    samplerates = set(r.samplerate for r in recordings)
+    if len(samplerates) != 1:
+        raise Exception("Recordings with different samplerates can't be batched ("+str(samplerates)+")")
+    samplerate = samplerates.pop()
+
+    rng = np.random.default_rng(seed)
+    batch, lengths = make_batch(recordings)
+    scores = []
+    for augmentation in augmentations:
+        augmented = apply_augmentation(batch, lengths, samplerate, augmentation, rng)
+        augmented_recordings = [dataset.Recording(r.name, r.labels, augmented[i, :lengths[i]], samplerate) for i, r in enumerate(recordings)]
+        metrics = chunkedevaluation.evaluate_recordings(augmented_recordings, configuration, bootstrap_resamples=0)
+        score = metrics[metric]["f1-score"]
+        # An undefined f1-score (no correct detection) counts as 0, like a
+        # failed analysis in the optimizer
+        scores.append(0.0 if np.isnan(score) else score)
+    return {"augmentations":[describe(a) for a in augmentations],
+            "f1-scores":scores,
+            "mean_f1":float(np.mean(scores)),
+            "worst_f1":float(np.min(scores))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a configuration against in-memory augmentations of the dataset")
+    parser.add_argument("results_file", help="Optimizer results file (best-<method>-<buffer>res.txt)")
+    parser.add_argument("--audio-directory", default="audiofiles")
+    parser.add_argument("--labels-directory", default="onsets_labeled")
+    parser.add_argument("--seed", type=int, default=0)
+    cli_args = parser.parse_args()
+    configuration = onsetdetector.read_configuration(cli_args.results_file)
+    recordings = dataset.load_dataset(cli_args.audio_directory, cli_args.labels_directory)
+    result = score_configuration(configuration, recordings=recordings, seed=cli_args.seed)
+    for name, score in zip(result["augmentations"], result["f1-scores"]):
+        print("{:.4f}\t{}".format(score, name))
+    print("Mean f1-score: {:.4f}  Worst-case f1-score: {:.4f}".format(result["mean_f1"], result["worst_f1"]))
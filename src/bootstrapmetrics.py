@@ -0,0 +1,148 @@
+#! /usr/bin/python3
+#
+#  BOOTSTRAP CONFIDENCE INTERVALS FOR THE METRICS
+#
+# The optimizer selects on a single macro avg. (technique) f1-score computed on
+# a few tens of recordings, so many differences between solutions are noise.
+# This module computes bootstrap confidence intervals for that f1-score and for
+# the macro avg. (technique) mean delay, resampling recordings (not onsets).
+#
+# Every metric is a function of per-recording counters (TP, FP, FN and sum of
+# the delays of the true positives), so a bootstrap resample is just a vector
+# of weights (how many times each recording is drawn) and ALL the resamples
+# are computed with one matrix multiplication:
+#   weights (resamples x recordings) @ counters (recordings x groups*4)
+# instead of rerunning the analysis on thousands of resampled CSV files.
+#
+# NOTE: the f1-score of a group is computed as 2TP/(2TP+FP+FN), which is the
+#       same as "analize_delays.r" except that it is 0 (not NaN) for groups
+#       with no true positive. Groups absent from a resample are left out of
+#       the macro averages.
+#
+# It also provides a replacement operator for inspyred that uses the intervals
+# for noise-aware elitism (see noise_aware_replacement).
+
+import computeLatency
+import csv
+import functools
+import numpy as np
+
+TP, FP, FN, DELAY_SUM_MS = range(4)     # Columns of the counters
+NUM_RESAMPLES = 10000
+CONFIDENCE = 0.95
+
+## Read the per-recording counters from the delays CSV
+#  (written by perform_main_analysis in "computeLatency.py")
+#
+#  @return The recording names and a (recordings x 4) array of counters
+#          (TP, FP, FN, sum of the delays in ms)
+#
+def read_delays_csv(delays_filename):
+    counters = {}
+    with open(delays_filename, "r") as delays_file:
+        for row in csv.DictReader(delays_file):
+            recording = counters.setdefault(row["recording"], [0, 0, 0, 0.0])
+            if row["difference"] != "NAN":
+                recording[TP] += 1
+                recording[DELAY_SUM_MS] += float(row["difference"])*1000.0
+            elif row["onset_labeled"] == "NAN":
+                recording[FP] += 1
+            else:
+                recording[FN] += 1
+    names = list(counters.keys())
+    return names, np.array([counters[name] for name in names], dtype=np.float64)
+
+## Bootstrap weights: how many times each recording is drawn in each resample
+#  Cached and generated with a fixed seed, so that all the solutions of a run
+#  are compared on the same resamples (common random numbers).
+#
+#  @return A read-only (num_resamples x num_recordings) array
+#
+@functools.lru_cache(maxsize=8)
+def resampling_weights(num_recordings, num_resamples=NUM_RESAMPLES, seed=0):
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(num_recordings, np.full(num_recordings, 1.0/num_recordings), size=num_resamples).astype(np.float64)
+    weights.flags.writeable = False
+    return weights
+
+## Macro avg. f1-score and mean delay over the techniques
+#
+#  @param counters : (... x techniques x 4) array of counters
+#
+#  @return Two arrays with the leading dimensions of @counters
+#
+def technique_averages(counters):
+    tp, fp, fn, delay_sum = (counters[..., column] for column in range(4))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        present = tp+fp+fn > 0
+        f1 = np.where(present, 2.0*tp/(2.0*tp+fp+fn), np.nan)
+        delay_mean = np.where(tp > 0, delay_sum/tp, np.nan)
+        f1_average = np.nansum(f1, axis=-1)/present.sum(axis=-1)
+        delay_average = np.nansum(delay_mean, axis=-1)/(tp > 0).sum(axis=-1)
+    return f1_average, delay_average
+
+## Percentile interval of the defined (not NaN) values
+def percentile_interval(values, confidence):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return float("nan"), float("nan")
+    low, high = np.percentile(values, [(1.0-confidence)/2.0*100.0, (1.0+confidence)/2.0*100.0])
+    return float(low), float(high)
+
+## Bootstrap confidence intervals of the metrics used by the optimizer
+#
+#  @param names          : Recording names (to find their technique)
+#  @param counters       : (recordings x 4) array of counters (see read_delays_csv)
+#  @param num_resamples  : Number of bootstrap resamples
+#  @param confidence     : Confidence level of the (percentile) intervals
+#
+#  @return A dict with the intervals of the macro avg. (technique) f1-score and
+#          mean delay (ms), as "low"/"high" pairs
+#
+def bootstrap_intervals(names, counters, num_resamples=NUM_RESAMPLES, confidence=CONFIDENCE, seed=0):
+    # Technique membership of each recording (recordings x techniques)
+    membership = np.array([[pattern in name for _, pattern in computeLatency.TECHNIQUES] for name in names], dtype=np.float64)
+    # Counters of each technique for each recording (recordings x techniques*4)
+    grouped = (membership[:, :, np.newaxis]*counters[:, np.newaxis, :]).reshape(len(names), -1)
+
+    weights = resampling_weights(len(names), num_resamples, seed)
+    resampled = (weights @ grouped).reshape(num_resamples, len(computeLatency.TECHNIQUES), 4)
+    f1_scores, delays = technique_averages(resampled)
+
+    f1_low, f1_high = percentile_interval(f1_scores, confidence)
+    delay_low, delay_high = percentile_interval(delays, confidence)
+    return {"num_resamples":num_resamples,
+            "confidence":confidence,
+            "f1-score":{"low":f1_low, "high":f1_high},
+            "mavg_t_mean":{"low":delay_low, "high":delay_high}}
+
+## Lower confidence bound of the f1-score of an individual
+#
+#  @param individual : inspyred Individual
+#  @param intervals  : Dict of f1-score intervals by candidate (tuple)
+#
+#  @return The lower bound, or the fitness if there is no interval
+#          (e.g. failed evaluation)
+#
+def lower_bound(individual, intervals):
+    interval = intervals.get(tuple(individual.candidate))
+    return interval["low"] if interval is not None else individual.fitness
+
+## Replacement with noise-aware elitism (inspyred replacer)
+#  Like inspyred.ec.replacers.generational_replacement, but the elites are the
+#  individuals with the best LOWER CONFIDENCE BOUND of the f1-score, not the
+#  best point estimate, so a solution that was lucky on this set of recordings
+#  is less likely to survive over a consistently good one.
+#
+#  Optional keyword arguments in args:
+#  - *num_elites*      -- number of elites to consider (default 0)
+#  - *fitness_intervals* -- dict of f1-score intervals by candidate (tuple)
+#
+def noise_aware_replacement(random, population, parents, offspring, args):
+    num_elites = args.setdefault("num_elites", 0)
+    intervals = args.setdefault("fitness_intervals", {})
+    population.sort(key=lambda individual: lower_bound(individual, intervals), reverse=True)
+    offspring.extend(population[:num_elites])
+    offspring.sort(reverse=True)
+    survivors = offspring[:len(population)]
+    return survivors
@@ -0,0 +1,355 @@
+#! /usr/bin/python3
+#
+#  BOUNDED-MEMORY CHUNKED EVALUATION
+#
+# perform_main_analysis ("computeLatency.py") writes all the onsets of a run to
+# a CSV file which is then loaded as a whole by the R analysis script.
+# That is fine for short single-technique clips, but not for hour-long session
+# recordings with thousands of onsets.
+#
+# This module evaluates a configuration with memory use that does not depend on
+# the length of the recordings:
+# - Audio is decoded in fixed-size blocks ("audioio.read_wav_blocks")
+# - The aubio detector state is carried across blocks ("onsetdetector.py")
+# - Labels are read lazily and matched with the extracted onsets as they come
+#   (same matching rules as computeDifference in "computeLatency.py")
+# - Metrics are aggregated as streaming counters (TP, FP, FN) and mergeable
+#   delay statistics (running moments plus a fixed-resolution histogram, used
+#   as a quantile sketch) for the same groups of "analize_delays.r"
+# - Per-recording counters are kept for the bootstrap confidence intervals
+#   ("bootstrapmetrics.py")
+#
+# The result has the same structure returned by perform_main_analysis, so it
+# can be printed with computeLatency.create_string.
+# NOTE: groups (techniques, intensities) with no onsets are left out of the
+#       macro averages, while R would return NaN.
+#
+# Usage: chunkedevaluation.py <results_file> [--audio-directory D]
+#                             [--labels-directory L] [--block-size N]
+
+import argparse
+import audioio
+import bootstrapmetrics
+import collections
+import computeLatency
+import glob
+import math
+import numpy as np
+import onsetdetector
+import os
+
+# Same groups used in "utility_scripts/r_analysis/analize_delays.r"
+SOUNDTYPES = computeLatency.SOUNDTYPES
+INTENSITIES = computeLatency.INTENSITIES
+TECHNIQUES = computeLatency.TECHNIQUES
+
+## Mergeable delay statistics with constant memory
+#  Mean and variance are computed with running moments (Welford), quantiles
+#  with a histogram of fixed resolution over the acceptance window.
+class DelayStatistics():
+    ## @param min_ms, max_ms : Range of the delays (ms), values outside are
+    #                          counted in the first/last bin
+    #  @param resolution_ms  : Width of the histogram bins (ms)
+    def __init__(self, min_ms, max_ms, resolution_ms=0.01):
+        self.min_ms = min_ms
+        self.resolution_ms = resolution_ms
+        self.bins = np.zeros(int(math.ceil((max_ms-min_ms)/resolution_ms))+1, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value_ms):
+        self.count += 1
+        delta = value_ms - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(value_ms-self.mean)
+        index = int((value_ms-self.min_ms)//self.resolution_ms)
+        self.bins[min(max(index, 0), len(self.bins)-1)] += 1
+
+    ## Merge the statistics of @other into these (Chan et al.)
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta*delta*self.count*other.count/count
+        self.mean += delta*other.count/count
+        self.count = count
+        self.bins += other.bins
+
+    ## Sample variance (as var() in R)
+    def variance(self):
+        return self.m2/(self.count-1) if self.count > 1 else float("nan")
+
+    ## Approximate quantile, interpolated between ranks as quantile() in R
+    #  (type 7). Each ranked value is the center of its bin, so the error is
+    #  within half a bin (for values inside the histogram range).
+    def quantile(self, q):
+        if self.count == 0:
+            return float("nan")
+        h = q*(self.count-1)
+        rank = math.floor(h)
+        cumulative = np.cumsum(self.bins)
+        def value(r):
+            index = int(np.searchsorted(cumulative, r, side="right"))
+            return self.min_ms + (index+0.5)*self.resolution_ms
+        low = value(rank)
+        if rank+1 >= self.count:
+            return low
+        return low + (h-rank)*(value(rank+1)-low)
+
+    ## Fraction of the values strictly between @low and @high
+    def fraction_between(self, low, high):
+        if self.count == 0:
+            return float("nan")
+        centers = self.min_ms + (np.arange(len(self.bins))+0.5)*self.resolution_ms
+        return float(self.bins[(centers > low) & (centers < high)].sum())/self.count
+
+## Counters of a group of recordings
+class GroupCounters():
+    def __init__(self, max_onset_difference_s):
+        self.tp = 0
+        self.fp = 0
+        self.fn = 0
+        self.delays = DelayStatistics(-max_onset_difference_s*1000.0, max_onset_difference_s*1000.0)
+
+    def merge(self, other):
+        self.tp += other.tp
+        self.fp += other.fp
+        self.fn += other.fn
+        self.delays.merge(other.delays)
+
+    def total(self):
+        return self.tp + self.fp + self.fn
+
+    ## Accuracy, precision, recall and f1-score (as in "analize_delays.r")
+    def metrics(self):
+        div = lambda a, b: a/b if b != 0 else float("nan")
+        precision = div(self.tp, self.tp+self.fp)
+        recall = div(self.tp, self.tp+self.fn)
+        return {"accuracy":div(self.tp, self.total()),
+                "precision":precision,
+                "recall":recall,
+                "f1-score":div(2.0*precision*recall, precision+recall)}
+
+## Streaming metrics for all the groups of the analysis
+class StreamingMetrics():
+    def __init__(self, max_onset_difference_s=0.02):
+        self.max_onset_difference_s = max_onset_difference_s
+        self.groups = collections.OrderedDict()
+        for name, _ in [("global", None)] + SOUNDTYPES + INTENSITIES + TECHNIQUES:
+            self.groups[name] = GroupCounters(max_onset_difference_s)
+        # Per-recording TP, FP, FN, sum of the delays (ms)
+        self.recordings = collections.OrderedDict()
+
+    def _recording(self, recording_name):
+        return self.recordings.setdefault(recording_name, [0, 0, 0, 0.0])
+
+    def _groups_of(self, recording_name):
+        yield self.groups["global"]
+        for name, pattern in SOUNDTYPES + INTENSITIES + TECHNIQUES:
+            if pattern in recording_name:
+                yield self.groups[name]
+
+    def add_true_positive(self, recording_name, difference_s):
+        for group in self._groups_of(recording_name):
+            group.tp += 1
+            group.delays.add(difference_s*1000.0)
+        recording = self._recording(recording_name)
+        recording[bootstrapmetrics.TP] += 1
+        recording[bootstrapmetrics.DELAY_SUM_MS] += difference_s*1000.0
+
+    def add_false_positive(self, recording_name):
+        for group in self._groups_of(recording_name):
+            group.fp += 1
+        self._recording(recording_name)[bootstrapmetrics.FP] += 1
+
+    def add_false_negative(self, recording_name):
+        for group in self._groups_of(recording_name):
+            group.fn += 1
+        self._recording(recording_name)[bootstrapmetrics.FN] += 1
+
+    def merge(self, other):
+        for name in self.groups:
+            self.groups[name].merge(other.groups[name])
+        for name, counters in other.recordings.items():
+            recording = self._recording(name)
+            for column, value in enumerate(counters):
+                recording[column] += value
+
+    ## Metrics with the same structure returned by perform_main_analysis
+    #  @param bootstrap_resamples : Resamples for the confidence intervals
+    #                               (0 to disable)
+    def relevant_metrics(self, bootstrap_resamples=bootstrapmetrics.NUM_RESAMPLES):
+        def macro_average(names):
+            present = [self.groups[n].metrics() for n in names if self.groups[n].total() > 0]
+            return {m:sum(g[m] for g in present)/len(present) if present else float("nan") for m in ["accuracy","precision","recall","f1-score"]}
+
+        techniques = [self.groups[n].delays for n, _ in TECHNIQUES if self.groups[n].delays.count > 0]
+        def technique_average(function):
+            values = [function(d) for d in techniques]
+            return sum(values)/len(values) if values else float("nan")
+        iqr = lambda d: d.quantile(0.75) - d.quantile(0.25)
+        lofence = lambda d: d.quantile(0.25) - 1.5*iqr(d)
+        hifence = lambda d: d.quantile(0.75) + 1.5*iqr(d)
+
+        metrics = {"glob_metrics":self.groups["global"].metrics(),
+                   "macroavg_metrics":macro_average([n for n, _ in SOUNDTYPES]),
+                   "macroavg_tech_metrics":macro_average([n for n, _ in TECHNIQUES]),
+                   "intensity_metrics":{n:self.groups[n].metrics() for n, _ in INTENSITIES},
+                   "mavg_t_mean":technique_average(lambda d: d.mean),
+                   "mavg_t_IQR":technique_average(iqr),
+                   "mavg_t_var":technique_average(lambda d: d.variance()),
+                   "mavg_t_SD":technique_average(lambda d: math.sqrt(d.variance())),
+                   "mavg_t_lofence":technique_average(lofence),
+                   "mavg_t_hifence":technique_average(hifence),
+                   "mavg_t_percIn":technique_average(lambda d: d.fraction_between(lofence(d), hifence(d))),
+                   "deprecated_delay":{    # Values printed by R when DO_PLOT is FALSE
+                       "adj_min":0.001,
+                       "adj_max":0.001,
+                       "avg":self.groups["global"].delays.mean,
+                       "perc":0.001
+                   }}
+        if bootstrap_resamples > 0 and self.recordings:
+            names = list(self.recordings.keys())
+            counters = np.array([self.recordings[name] for name in names], dtype=np.float64)
+            metrics["bootstrap"] = bootstrapmetrics.bootstrap_intervals(names, counters, bootstrap_resamples)
+        return metrics
+
+## Streaming version of computeDifference ("computeLatency.py")
+#  Labels and extracted onsets are merged as they come. Only the extracted
+#  onsets that still have to be compared with the next label are kept.
+class OnsetMatcher():
+    ## @param recording_name : Name of the recording (label filename)
+    #  @param labels         : Iterator of labeled onset times (s), sorted
+    #  @param delay_s        : Delay added by the detector to the onset times
+    #  @param metrics        : StreamingMetrics that receives the results
+    def __init__(self, recording_name, labels, delay_s, metrics, max_onset_difference_s=0.02, do_ignore_early_onsets=True):
+        self.recording_name = recording_name
+        self.labels = labels
+        self.delay_s = delay_s
+        self.metrics = metrics
+        self.max_onset_difference_s = max_onset_difference_s
+        self.do_ignore_early_onsets = do_ignore_early_onsets
+        self.next_label = next(self.labels, math.inf)
+        self.extracted = collections.deque()    # Pending extracted onsets
+
+    ## Add extracted onsets (detection times, s) and match what is possible
+    def add_extracted(self, detection_times):
+        # Back to the onset times reported by aubioonset
+        self.extracted.extend(t - self.delay_s for t in detection_times)
+        self._match(final=False)
+
+    ## Match the remaining onsets (end of the recording)
+    def finish(self):
+        self._match(final=True)
+
+    def _match(self, final):
+        while True:
+            if self.extracted:
+                ext_value = self.extracted[0]
+            elif final:
+                ext_value = math.inf
+            else:
+                return  # Wait for more extracted onsets
+            lbl_value = self.next_label
+            if lbl_value == math.inf and ext_value == math.inf:
+                return
+            diff = ext_value - lbl_value + self.delay_s
+            if abs(diff) < self.max_onset_difference_s and (not self.do_ignore_early_onsets or diff > 0):
+                self.metrics.add_true_positive(self.recording_name, diff)
+                self.next_label = next(self.labels, math.inf)
+                self.extracted.popleft()
+            elif lbl_value < ext_value:
+                self.metrics.add_false_negative(self.recording_name)
+                self.next_label = next(self.labels, math.inf)
+            elif lbl_value > ext_value:
+                self.metrics.add_false_positive(self.recording_name)
+                self.extracted.popleft()
+
+## Lazily read the onset times of a label file
+def read_labels(labels_file):
+    for line in labels_file:
+        if line.strip() != "":
+            yield float(line.split()[0])
+
+## Evaluate a configuration on a stream of audio blocks
+#
+#  @param recording_name : Name of the recording (label filename)
+#  @param blocks         : Iterable of float32 mono blocks
+#  @param samplerate     : Samplerate of the audio
+#  @param labels         : Iterable of labeled onset times (s), sorted
+#  @param configuration  : Dict of parameters for onsetdetector.OnsetDetector
+#  @param metrics        : StreamingMetrics that receives the results
+#
+def evaluate_blocks(recording_name, blocks, samplerate, labels, configuration, metrics, max_onset_difference_s=0.02, do_ignore_early_onsets=True):
+    detector = onsetdetector.OnsetDetector(samplerate=samplerate, **configuration)
+    matcher = OnsetMatcher(recording_name, iter(labels), detector.delay_s, metrics, max_onset_difference_s, do_ignore_early_onsets)
+    for block in blocks:
+        matcher.add_extracted(detector.process(block))
+    matcher.add_extracted(detector.flush())
+    matcher.finish()
+
+## Evaluate a configuration on a single recording, one block at a time
+#
+#  @param audio_path    : Path of the WAV file
+#  @param labels_path   : Path of the label file
+#  @param configuration : Dict of parameters for onsetdetector.OnsetDetector
+#  @param metrics       : StreamingMetrics that receives the results
+#  @param block_size    : Samples decoded at a time
+#
+def evaluate_recording(audio_path, labels_path, configuration, metrics, block_size=4096, max_onset_difference_s=0.02, do_ignore_early_onsets=True):
+    with open(labels_path, "r") as labels_file:
+        evaluate_blocks(os.path.basename(labels_path), audioio.read_wav_blocks(audio_path, block_size), audioio.wav_samplerate(audio_path),
+                        read_labels(labels_file), configuration, metrics, max_onset_difference_s, do_ignore_early_onsets)
+
+## Evaluate a configuration on recordings already loaded in memory
+#  (see dataset.load_dataset)
+#
+#  @param recordings    : Iterable of dataset.Recording
+#  @param configuration : Dict of parameters for onsetdetector.OnsetDetector
+#
+#  @return The metrics, with the same structure returned by perform_main_analysis
+#
+def evaluate_recordings(recordings, configuration, block_size=4096, max_onset_difference_s=0.02, do_ignore_early_onsets=True, bootstrap_resamples=bootstrapmetrics.NUM_RESAMPLES):
+    metrics = StreamingMetrics(max_onset_difference_s)
+    for recording in recordings:
+        blocks = (recording.samples[i:i+block_size] for i in range(0, len(recording.samples), block_size))
+        evaluate_blocks(recording.name, blocks, recording.samplerate, recording.labels, configuration, metrics, max_onset_difference_s, do_ignore_early_onsets)
+    return metrics.relevant_metrics(bootstrap_resamples)
+
+## Evaluate a configuration on a dataset with bounded memory
+#
+#  @param audio_directory  : Directory containing audio files
+#  @param configuration    : Dict of parameters for onsetdetector.OnsetDetector
+#                            (see onsetdetector.read_configuration)
+#  @param labels_directory : Directory containing the label files
+#  @param block_size       : Samples decoded at a time
+#
+#  @return A dict with parameters and one with metrics (as perform_main_analysis)
+#
+def evaluate(audio_directory, configuration, labels_directory="onsets_labeled", block_size=4096, max_onset_difference_s=0.02, do_ignore_early_onsets=True, bootstrap_resamples=bootstrapmetrics.NUM_RESAMPLES):
+    metrics = StreamingMetrics(max_onset_difference_s)
+    for labels_path in sorted(glob.glob(labels_directory+"/*.txt")):
+        recording = os.path.basename(labels_path)[:-4]
+        audio_path = computeLatency.find_similar_file(audio_directory+"/"+recording+".wav")
+        evaluate_recording(audio_path, labels_path, configuration, metrics, block_size, max_onset_difference_s, do_ignore_early_onsets)
+    info = {"onset_method":configuration["onset_method"],
+            "buffer_size":configuration["buffer_size"],
+            "hop_size":configuration["hop_size"],
+            "minimum_inter_onset_interval_s":configuration["minimum_inter_onset_interval_s"],
+            "silence_threshold":configuration["silence_threshold"],
+            "onset_threshold":configuration["onset_threshold"],
+            "results_filename":"chunked-evaluation"}
+    return info, metrics.relevant_metrics(bootstrap_resamples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bounded-memory evaluation of an aubio onset configuration")
+    parser.add_argument("results_file", help="Optimizer results file (best-<method>-<buffer>res.txt)")
+    parser.add_argument("--audio-directory", default="audiofiles")
+    parser.add_argument("--labels-directory", default="onsets_labeled")
+    parser.add_argument("--block-size", type=int, default=4096, help="Samples decoded at a time")
+    cli_args = parser.parse_args()
+    configuration = onsetdetector.read_configuration(cli_args.results_file)
+    info, metrics = evaluate(cli_args.audio_directory, configuration, cli_args.labels_directory, cli_args.block_size)
+    print(computeLatency.create_string(info, metrics))
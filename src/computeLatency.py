@@ -39,14 +39,83 @@
 ##
 _VERBOSE = False # Print info
 
+import functools        # To cache the label index
 import glob             # To read folder filelist
+import io               # To collect the results of each recording
 import os               # To call scripts
 import re               # Regexp, to parse script results
+import subprocess       # To call scripts concurrently
+from concurrent.futures import ThreadPoolExecutor # To process recordings concurrently
 from enum import Enum   # To specify parameter type
 import sys
 import tempfile         # It allows to have univoque tmp dirs for each run
                         # (To allow parallel execution)
 
+# Groups of recordings used in "utility_scripts/r_analysis/analize_delays.r"
+# (name, pattern in the recording name)
+SOUNDTYPES = [("percussive","_percussive_"), ("pitched","_pitched_")]
+INTENSITIES = [("piano","_p_"), ("mezzoforte","_mf_"), ("forte","_f_")]
+TECHNIQUES = [(t, t) for t in ["keybed","kick","lowerside","thumb","palmmute","naturalharmonics","picknearbridge","soundhole"]]
+
+## Delay (in samples) that aubioonset subtracts from the detection time
+#  This is the same value computed (and printed) by
+#  "utility_scripts/extractAllOnsets.sh", which in turn mirrors aubio.
+#
+#  @param onset_method : Aubioonset method
+#  @param hop_size     : Hop size (samples)
+#
+def aubio_delay_samples(onset_method,hop_size):
+    if onset_method == "complex":
+        return int(hop_size*4.6)
+    return int(hop_size*4.3)
+
+# This functions uses pattern search to find a file with a similar name to the one specified.
+# For similar I mean a file in the same folder, with the same extension,
+# beginning with the same name but (potentially) with more characters after the
+# original name. Example:
+# filename = "somefolder/somefilename.txt"
+# found    = "somefolder/somefilename_secondversion.txt"
+# "found" IS CONSIDERED A SIMILAR FILENAME
+def find_similar_file(filename):
+    filenameonly = filename[:-4]
+    extonly = filename[-4:]
+    searchpattern = filenameonly + "*" + extonly
+    filesfound = glob.glob(searchpattern)
+    # Terminate if NO file found, or more than one found
+    if len(filesfound) != 1:
+        raise Exception("Found "+str(len(filesfound))+" similar files instead of 1 (\""+filename+"\")")
+    return filesfound[0]
+
+## List of the label files (the label index)
+#  It is cached, so that long running processes (e.g. the optimizer workers)
+#  read the folder only once.
+@functools.lru_cache(maxsize=None)
+def load_label_index(labels_directory="onsets_labeled"):
+    return tuple(glob.glob(labels_directory+"/*.txt"))
+
+## Extract the onsets of a single recording with "extractOnset.sh"
+#  This is what "utility_scripts/extractAllOnsets.sh" does for each recording
+#  of the folder, as a separate process so that recordings can be processed
+#  concurrently.
+#
+#  @param audio_file       : Path of the WAV file (<audio_directory>/<name>.wav)
+#  @param onsets_directory : Output directory (onsets written to <name>.txt)
+#  Other parameters as perform_main_analysis
+#
+def extract_onsets(audio_file,onsets_directory,aubioonset_command,onset_method,buffer_size,hop_size,silence_threshold,onset_threshold,minimum_inter_onset_interval_s):
+    environment = dict(os.environ,
+                       AUBIOONSET_COMMAND=str(aubioonset_command),
+                       BUFFER_SIZE=str(buffer_size),
+                       HOP_SIZE=str(hop_size),
+                       SILENCE_THRESHOLD=str(silence_threshold),
+                       ONSET_THRESHOLD=str(onset_threshold),
+                       ONSET_METHOD=str(onset_method),
+                       MINIMUM_INTER_ONSET_INTERVAL_SECONDS=str(minimum_inter_onset_interval_s),
+                       ONSET_OUT_DIR=str(onsets_directory))
+    result = subprocess.run(["bash","./utility_scripts/extractOnset.sh",audio_file],env=environment,stdout=subprocess.DEVNULL,stderr=subprocess.PIPE,text=True)
+    if re.search("extractOnset.sh: line",result.stderr) != None:
+        print("Error in extractOnset.sh: " + result.stderr.strip())
+
 ## Function that performs the analysis and compute all the relevant metrics
 #
 #  @param audio_directory                : Directory containing audio files
@@ -62,50 +131,63 @@ import tempfile         # It allows to have univoque tmp dirs for each run
 #  @param samplerate                     : Audio Sample rate
 #  @param failsafe                       : Avoid raising errors if True
 #  @param save_results                   : Keep record of results in a file
+#  @param bootstrap_resamples            : Resamples for the confidence
+#                                          intervals (see "bootstrapmetrics.py",
+#                                          0 to disable)
+#  @param num_workers                    : Recordings processed concurrently
+#                                          (1: "extractAllOnsets.sh" loop)
 #
 #  @return It returns a dict with parameters and one with metrics
 #
-def perform_main_analysis(audio_directory,aubioonset_command,onset_method,buffer_size,hop_size,silence_threshold,onset_threshold,minimum_inter_onset_interval_s,max_onset_difference_s=0.02,do_ignore_early_onsets=True,samplerate=48000, failsafe=True,save_results=True):
+def perform_main_analysis(audio_directory,aubioonset_command,onset_method,buffer_size,hop_size,silence_threshold,onset_threshold,minimum_inter_onset_interval_s,max_onset_difference_s=0.02,do_ignore_early_onsets=True,samplerate=48000, failsafe=True,save_results=True,bootstrap_resamples=10000,num_workers=1):
     with tempfile.TemporaryDirectory(prefix="aubioonsetanalysis-") as TEMP_FOLDER:
         TEMP_FOLDER=TEMP_FOLDER+"/"
         ONSETS_EXTRACTED_DIR = TEMP_FOLDER+"onsets_extracted/"
         ONSETS_LABELED_DIR="onsets_labeled/"    # This is not in the temp folder
-        LOGRES_DIR = "results/"
-
-        # Create the option string with the parameter values specified
-        opts = " -C " + str(aubioonset_command) + \
-               " -B " + str(buffer_size) + \
-               " -H " + str(hop_size) + \
-               " -s " + str(silence_threshold) + \
-               " -t " + str(onset_threshold) + \
-               " -O " + str(onset_method) + \
-               " -M " + str(minimum_inter_onset_interval_s) + \
-               " -e " + str(TEMP_FOLDER) + \
-               " -d " + audio_directory + "/" + ""
-
-        # Call onset extraction routine
-        COMMAND = "./utility_scripts/extractAllOnsets.sh " + opts
-        if _VERBOSE:
-            print("Calling "+COMMAND)
-        EXT_RES = os.popen(COMMAND).read()
-
-        if re.search("line",EXT_RES) != None:
-            print("Error in extractOnset.sh: " + str(re.search("extractOnset.sh: line",EXT_RES).group(0)))
-
-        # Parse script output, looking for the AUBIOONSET delay (in samples)
-        '''
-            Aubioonset computes the onset time by subtracting a fixed time
-            period to the detection time.
-            We are interested in the detection time, so we add to the reported
-            time, the delay parameter used.
-            Since the parameter is set inside of aubio, for the time being we
-            compute the delay depending on the input parameters, in the same way
-            that aubio does it.
-            NB: this is susceptible to changes in Aubio, it should be improved
-        '''
-        PARTIAL_STRING = re.search("To get the real detection time, add the delay of [0-9]+ samples",EXT_RES).group(0)
-
-        AUBIODELAY_SAMPLES = int(re.search('[0-9]+', PARTIAL_STRING).group(0))
+        # Logs that are not kept go in the temp folder, so that concurrent
+        # evaluations of the same configuration do not share the same file
+        LOGRES_DIR = "results/" if save_results else TEMP_FOLDER
+
+        if num_workers > 1:
+            # Onsets are extracted recording by recording, concurrently with the
+            # comparison (see below). The delay is the one that
+            # "extractAllOnsets.sh" would print
+            AUBIODELAY_SAMPLES = aubio_delay_samples(onset_method,hop_size)
+        else:
+            # Create the option string with the parameter values specified
+            opts = " -C " + str(aubioonset_command) + \
+                   " -B " + str(buffer_size) + \
+                   " -H " + str(hop_size) + \
+                   " -s " + str(silence_threshold) + \
+                   " -t " + str(onset_threshold) + \
+                   " -O " + str(onset_method) + \
+                   " -M " + str(minimum_inter_onset_interval_s) + \
+                   " -e " + str(TEMP_FOLDER) + \
+                   " -d " + audio_directory + "/" + ""
+
+            # Call onset extraction routine
+            COMMAND = "./utility_scripts/extractAllOnsets.sh " + opts
+            if _VERBOSE:
+                print("Calling "+COMMAND)
+            EXT_RES = os.popen(COMMAND).read()
+
+            if re.search("line",EXT_RES) != None:
+                print("Error in extractOnset.sh: " + str(re.search("extractOnset.sh: line",EXT_RES).group(0)))
+
+            # Parse script output, looking for the AUBIOONSET delay (in samples)
+            '''
+                Aubioonset computes the onset time by subtracting a fixed time
+                period to the detection time.
+                We are interested in the detection time, so we add to the reported
+                time, the delay parameter used.
+                Since the parameter is set inside of aubio, for the time being we
+                compute the delay depending on the input parameters, in the same way
+                that aubio does it.
+                NB: this is susceptible to changes in Aubio, it should be improved
+            '''
+            PARTIAL_STRING = re.search("To get the real detection time, add the delay of [0-9]+ samples",EXT_RES).group(0)
+
+            AUBIODELAY_SAMPLES = int(re.search('[0-9]+', PARTIAL_STRING).group(0))
         AUBIODELAY_S = AUBIODELAY_SAMPLES * 1.0 / samplerate
         if _VERBOSE:
             print("The delay introduced by aubioonset is " + str(AUBIODELAY_SAMPLES) + " samples")
@@ -141,24 +223,7 @@ def perform_main_analysis(audio_directory,aubioonset_command,onset_method,buffer
                     elif lbl_value > ext_value:
                         out_file.write(NAN_STR + SEP_STR + str(ext_value) + SEP_STR + NAN_STR + SEP_STR + recording_name + "\n")
                         ext_line = extracted_file.readline()
-        # This functions uses pattern search to find a file with a similar name to the one specified.
-        # For similar I mean a file in the same folder, with the same extension,
-        # beginning with the same name but (potentially) with more characters after the
-        # original name. Example:
-        # filename = "somefolder/somefilename.txt"
-        # found    = "somefolder/somefilename_secondversion.txt"
-        # "found" IS CONSIDERED A SIMILAR FILENAME
-        def find_similar_file(filename):
-            filenameonly = filename[:-4]
-            extonly = filename[-4:]
-            searchpattern = filenameonly + "*" + extonly
-            filesfound = glob.glob(searchpattern)
-            # Terminate if NO file found, or more than one found
-            if len(filesfound) != 1:
-                raise Exception("Found "+str(len(filesfound))+" similar files instead of 1 (\""+filename+"\")")
-            return filesfound[0]
-
-        onsets_labeled = glob.glob("onsets_labeled/*.txt")
+        onsets_labeled = load_label_index(ONSETS_LABELED_DIR[:-1])
         # Open output file
         OUT_DIR = TEMP_FOLDER+"output/"
         os.system("mkdir -p "+OUT_DIR)
@@ -168,13 +233,29 @@ def perform_main_analysis(audio_directory,aubioonset_command,onset_method,buffer
         output_csv.write("onset_labeled" + SEP_STR + "onset_extracted" + SEP_STR + "difference" + SEP_STR + "recording\n")
 
         # Iterate over all label files and call computeDifference() for all files
-        for filename in onsets_labeled:
-            filename = os.path.basename(filename)
-            file_labels = open(ONSETS_LABELED_DIR+filename, "r")
-            file_extrac = open(find_similar_file(ONSETS_EXTRACTED_DIR+filename), "r")
-            computeDifference(filename,file_labels,file_extrac,output_csv)
-            file_labels.close()
-            file_extrac.close()
+        if num_workers > 1:
+            # One task per recording: onset extraction and comparison.
+            # The rows of each recording are collected and written in the order
+            # of the label index, so the CSV is the same of the serial loop
+            def analyzeRecording(filename):
+                filename = os.path.basename(filename)
+                audio_file = find_similar_file(audio_directory+"/"+filename[:-4]+".wav")
+                extract_onsets(audio_file,ONSETS_EXTRACTED_DIR,aubioonset_command,onset_method,buffer_size,hop_size,silence_threshold,onset_threshold,minimum_inter_onset_interval_s)
+                rows = io.StringIO()
+                with open(ONSETS_LABELED_DIR+filename, "r") as file_labels, open(find_similar_file(ONSETS_EXTRACTED_DIR+filename), "r") as file_extrac:
+                    computeDifference(filename,file_labels,file_extrac,rows)
+                return rows.getvalue()
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                for rows in pool.map(analyzeRecording, onsets_labeled):
+                    output_csv.write(rows)
+        else:
+            for filename in onsets_labeled:
+                filename = os.path.basename(filename)
+                file_labels = open(ONSETS_LABELED_DIR+filename, "r")
+                file_extrac = open(find_similar_file(ONSETS_EXTRACTED_DIR+filename), "r")
+                computeDifference(filename,file_labels,file_extrac,output_csv)
+                file_labels.close()
+                file_extrac.close()
 
         output_csv.close()
 
@@ -261,8 +342,13 @@ def perform_main_analysis(audio_directory,aubioonset_command,onset_method,buffer
                 relevant_metrics = None
         else:
             relevant_info, relevant_metrics = process_R_results(logres_filename)
-        if save_results is not True:
-            os.system("rm -rf "+logres_filename)
+
+        # Bootstrap confidence intervals, from the per-recording counts in the
+        # delays CSV (before the temp folder is deleted)
+        if relevant_metrics is not None and bootstrap_resamples > 0:
+            import bootstrapmetrics
+            names, counters = bootstrapmetrics.read_delays_csv(DELAYS_FILE)
+            relevant_metrics["bootstrap"] = bootstrapmetrics.bootstrap_intervals(names, counters, bootstrap_resamples)
         return relevant_info, relevant_metrics
 
 def create_string(info,metrics,use_oldformat=False,do_copy = False,failsafe = True):
@@ -312,6 +398,15 @@ def create_string(info,metrics,use_oldformat=False,do_copy = False,failsafe = Tr
         output_string += "{:.4f}".format(metrics["mavg_t_percIn"])+"\t"
 
         output_string += " \t"+info["results_filename"]
+
+        # Bootstrap confidence intervals (after the logfile name, so that the
+        # other columns do not move)
+        if "bootstrap" in metrics:
+            output_string += "\t \t"
+            output_string += "{:.4f}".format(metrics["bootstrap"]["f1-score"]["low"])+"\t"
+            output_string += "{:.4f}".format(metrics["bootstrap"]["f1-score"]["high"])+"\t"
+            output_string += "{:.4f}".format(metrics["bootstrap"]["mavg_t_mean"]["low"])+"\t"
+            output_string += "{:.4f}".format(metrics["bootstrap"]["mavg_t_mean"]["high"])
     if do_copy:
         import pyperclip
         pyperclip.copy(output_string)
@@ -330,6 +425,9 @@ def main():
     # If true, consider as false positives all onsets detected before the label
     IGNORE_NEG = True
 
+    # Recordings processed concurrently (one per core)
+    NUM_WORKERS = os.cpu_count()
+
     # AUDIO_DIRECTORY = "compressed-audiofiles-soft-00"
     # AUDIO_DIRECTORY = "compressed-audiofiles-hard-02"
     # AUDIO_DIRECTORY = "gated-audiofiles-01"
@@ -413,7 +511,7 @@ def main():
         ONSET_METHOD = READ_METHOD
     MINIMUM_INTER_ONSET_INTERVAL_SECONDS = 0.020 #readParam("MINIMUM_INTER_ONSET_INTERVAL_SECONDS",0.020,ParamType.FLOAT)
 
-    relevant_info, relevant_metrics = perform_main_analysis(AUDIO_DIRECTORY,AUBIOONSET_COMMAND,ONSET_METHOD,BUFFER_SIZE,HOP_SIZE,SILENCE_THRESHOLD,ONSET_THRESHOLD,MINIMUM_INTER_ONSET_INTERVAL_SECONDS,MAX_ONSET_DIFFERENCE_S,IGNORE_NEG)
+    relevant_info, relevant_metrics = perform_main_analysis(AUDIO_DIRECTORY,AUBIOONSET_COMMAND,ONSET_METHOD,BUFFER_SIZE,HOP_SIZE,SILENCE_THRESHOLD,ONSET_THRESHOLD,MINIMUM_INTER_ONSET_INTERVAL_SECONDS,MAX_ONSET_DIFFERENCE_S,IGNORE_NEG,num_workers=NUM_WORKERS)
     print(create_string(relevant_info,relevant_metrics, do_copy=True))
 
 if __name__ == "__main__":
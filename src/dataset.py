@@ -0,0 +1,40 @@
+#! /usr/bin/python3
+#
+#  IN-MEMORY DATASET
+#
+# Loads the labeled recordings (audio as float32 arrays and onset labels) once
+# per process. Loads are cached, so a process that preloads the dataset (e.g.
+# the forkserver of "workerpool.py") passes it to all the workers forked from
+# it at no cost.
+
+import audioio
+import collections
+import computeLatency
+import functools
+import os
+
+Recording = collections.namedtuple("Recording", ["name", "labels", "samples", "samplerate"])
+
+## Onset times of a label file
+def read_label_times(labels_path):
+    with open(labels_path, "r") as labels_file:
+        return tuple(float(line.split()[0]) for line in labels_file if line.strip() != "")
+
+## Load all the labeled recordings
+#  The recordings follow the order of the label index, like
+#  perform_main_analysis ("computeLatency.py").
+#
+#  @param audio_directory  : Directory containing audio files
+#  @param labels_directory : Directory containing the label files
+#
+#  @return A tuple of Recording (name is the label filename)
+#
+@functools.lru_cache(maxsize=None)
+def load_dataset(audio_directory="audiofiles", labels_directory="onsets_labeled"):
+    recordings = []
+    for labels_path in computeLatency.load_label_index(labels_directory):
+        name = os.path.basename(labels_path)
+        audio_path = computeLatency.find_similar_file(audio_directory+"/"+name[:-4]+".wav")
+        samples, samplerate = audioio.read_wav(audio_path)
+        recordings.append(Recording(name, read_label_times(labels_path), samples, samplerate))
+    return tuple(recordings)
@@ -21,15 +21,16 @@
 # each combination of buffer_size and onset_method on separate terminals.
 # This is possible since the evaluator script allows concurrent execution
 #
-# NOTE: It would be better to parallelize the evaluation of solutions internally
-#       (in this script) and it can theoretically be done since INSPYRED is
-#       compatible with both the multiprocessing module and the pp (parallel
-#       python) module.
-#       I wasn't able to get MP to work (pickling issue) while PP run apparently
-#       smoothly, but it always stopped at the same generation without throwing
-#       any error (clean logs)
-#       Note that the "stopping" generation would change when changing the
-#       number of processes to spawn.
+# Solutions can also be evaluated concurrently inside a run ("--workers N"),
+# with a pool of threads (each evaluation runs aubioonset and R as separate
+# processes) or, with "--worker-type processes", with a pool of worker
+# processes forked from a preloaded fork server (see "workerpool.py").
+# "--mode async" replaces the generational EA with a steady-state
+# one that does not wait for the slowest evaluation of a generation (see
+# "steadystate.py").
+# NOTE: inspyred's own multiprocessing (MP) and parallel python (PP)
+#       evaluators did not work here (pickling issue with MP, PP stopping at a
+#       fixed generation without errors), see PARALLEL below.
 
 # #----------------------------------------------------------------------------#
 # # (Current) Problem Formalization                                            #
@@ -71,10 +72,15 @@
 
 import inspyred             # Evoliutionary Computation Framework
 import computeLatency       # My own evaluation script for Aubio
-import pylab                # For plots
+import steadystate          # Asynchronous steady-state evolution
+import warmstart            # Warm start from previous results, early stopping
+import bootstrapmetrics     # Confidence intervals of the fitness
+import telemetry            # Per-generation statistics (and final plot)
+import workerpool           # Pool of preloaded worker processes
 from random import Random
-import sys
 import os
+import time
+import argparse
 
 PARALLEL = False            # Failed tentative of internal parallelization
 RESFOLDER="evolutionaryOptimizerResults/"
@@ -117,6 +123,27 @@ gaussianStdev = 3.0                 # stdev for gaussian mutation
 crossoverRate = 0.7                 # Rate of crossover operation
 selectionSize = populationSize
 numElites = 1                       # See elitim (n best solutions kept in gen.)
+# Evaluation budget: the generational EA evaluates the initial population plus
+# one full generation of offspring for each generation. The steady-state mode
+# uses the same budget so that the two can be compared.
+numberOfEvaluations = populationSize*(numberOfGenerations+1)
+
+# """--Concurrent evaluation--------------------------------------------------"""
+default_mode = "generational"       # "generational" or "async" (steady-state)
+default_num_workers = 1             # Concurrent evaluations
+default_worker_type = "threads"     # "threads" or "processes" (workerpool.py)
+
+# """--Warm start and early stopping-----------------------------------------"""
+warmStartFraction = 0.5             # Fraction of the initial population seeded
+                                    # with previous results (rest is random)
+stallGenerations = 0                # Stop after these generations without
+                                    # improvement (0: disabled)
+stallTolerance = 0.0001             # Minimum improvement of the best fitness
+
+# """--Noise-aware elitism---------------------------------------------------"""
+noiseAwareElitism = False           # Keep the elites with the best lower
+                                    # confidence bound of the fitness
+                                    # (bootstrap over the recordings)
 
 # """--Visualization---------------------------------------------------------"""
 display = True
@@ -130,6 +157,10 @@ class ConfigurationEvaluator():
                              # used
         self.maximize = True # Flag to define the problem nature
         self.aubioparameters = aubioparameters
+        self.intervals = {}  # Bootstrap interval of the fitness of each
+                             # evaluated candidate (tuple)
+        self.pool = None     # Pool of worker processes that run the analyses
+                             # (None: run them in this process)
 
     ## Generator method
     #  This generates new individuals randomly
@@ -138,34 +169,54 @@ class ConfigurationEvaluator():
         silence_threshold = self.rng.uniform(MIN_SILENCE_THRESH, MAX_SILENCE_THRESH)
         return [onset_threshold,silence_threshold]
 
+    ## Evaluate a single candidate
+    #  @return The fitness of @candidate (macro avg. f1-score)
+    def evaluate(self, candidate):
+        if self.pool is not None:
+            metrics = self.pool.submit(analyze_candidate, self.aubioparameters, candidate).result()
+        else:
+            metrics = analyze_candidate(self.aubioparameters, candidate)
+        if metrics:
+            fitness_c  = metrics["macroavg_tech_metrics"]["f1-score"]
+            if "bootstrap" in metrics:
+                self.intervals[tuple(candidate)] = metrics["bootstrap"]["f1-score"]
+        else:
+            fitness_c = 0
+        return fitness_c
+
     ## Evaluator method
     #  This evaluates the fitness of the given individual/s (@candidates)
     def evaluator(self, candidates, args):
         fitness = []
         for candidate in candidates:
-            onset_threshold = candidate[0]
-            silence_threshold = candidate[1]
-            info, metrics = computeLatency.perform_main_analysis(audio_directory = self.aubioparameters['audio_directory'],
-                                                                 aubioonset_command = self.aubioparameters['aubioonset_command'],
-                                                                 onset_method = self.aubioparameters['onset_method'],
-                                                                 buffer_size = self.aubioparameters['buffer_size'],
-                                                                 hop_size = self.aubioparameters['hop_size'],
-                                                                 silence_threshold = silence_threshold,
-                                                                 onset_threshold = onset_threshold,
-                                                                 minimum_inter_onset_interval_s = self.aubioparameters['minimum_inter_onset_interval_s'],
-                                                                 max_onset_difference_s = self.aubioparameters['max_onset_difference_s'],
-                                                                 do_ignore_early_onsets = self.aubioparameters['do_ignore_early_onsets'],
-                                                                 samplerate = self.aubioparameters['samplerate'],
-                                                                 failsafe = self.aubioparameters['failsafe'],
-                                                                 save_results=False)
-            if metrics:
-                fitness_c  = metrics["macroavg_tech_metrics"]["f1-score"]
-            else:
-                fitness_c = 0
-            fitness.append(fitness_c)
+            fitness.append(self.evaluate(candidate))
         return fitness
 
-def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size, display=False, runstring=""):
+## Analysis of a candidate (also the task of the worker processes)
+#  @return The metrics dict (as returned by perform_main_analysis)
+def analyze_candidate(aubioparameters, candidate):
+    onset_threshold = candidate[0]
+    silence_threshold = candidate[1]
+    info, metrics = computeLatency.perform_main_analysis(audio_directory = aubioparameters['audio_directory'],
+                                                         aubioonset_command = aubioparameters['aubioonset_command'],
+                                                         onset_method = aubioparameters['onset_method'],
+                                                         buffer_size = aubioparameters['buffer_size'],
+                                                         hop_size = aubioparameters['hop_size'],
+                                                         silence_threshold = silence_threshold,
+                                                         onset_threshold = onset_threshold,
+                                                         minimum_inter_onset_interval_s = aubioparameters['minimum_inter_onset_interval_s'],
+                                                         max_onset_difference_s = aubioparameters['max_onset_difference_s'],
+                                                         do_ignore_early_onsets = aubioparameters['do_ignore_early_onsets'],
+                                                         samplerate = aubioparameters['samplerate'],
+                                                         failsafe = aubioparameters['failsafe'],
+                                                         save_results=False,
+                                                         bootstrap_resamples = aubioparameters['bootstrap_resamples'])
+    return metrics
+
+## Parameters for the evaluation of the solutions (fixed aubio parameters)
+#  @param bootstrap_resamples : Resamples for the confidence intervals of the
+#                               fitness (0: not computed)
+def create_aubioparameters(onset_method, buffer_size, bootstrap_resamples=0):
     # Initialization of some aubio parameter
     aubioonset_command = AUBIOONSET_COMMAND
     real_onset_method = onset_method
@@ -188,27 +239,12 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
                        "do_ignore_early_onsets" : True,
                        "samplerate" : 48000,
                        "failsafe" : True,
+                       "bootstrap_resamples" : bootstrap_resamples,
                        "real_onset_method":real_onset_method}
-    # Create an instance of the problem and feed the current pseudo-random
-    # generator
-    problem = ConfigurationEvaluator(rng,aubioparameters)
-
-    # - INSPYRED INITIALIZATION ---------------------------------------------- #
-
-    # the evolutionary algorithm (EvolutionaryComputation is a fully
-    # configurable evolutionary algorithm)
-    # standard GA, ES, SA, DE, EDA, PAES, NSGA2, PSO and ACO are also available
-    ea = inspyred.ec.EvolutionaryComputation(rng)
-
-    # observers: provide various logging features
-    # if display:
-    ea.observer = [#inspyred.ec.observers.stats_observer,
-                   inspyred.ec.observers.file_observer,
-                   inspyred.ec.observers.plot_observer
-                    #inspyred.ec.observers.best_observer,
-                    #inspyred.ec.observers.population_observer
-                  ]
+    return aubioparameters
 
+## Set the selection, variation, replacement and termination operators of @ea
+def configure_operators(ea):
     # Selection operator
     # ea.selector = inspyred.ec.selectors.truncation_selection
     # ea.selector = inspyred.ec.selectors.uniform_selection
@@ -245,11 +281,56 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
     # ea.terminator = inspyred.ec.terminators.time_termination
     ea.terminator = inspyred.ec.terminators.generation_termination
 
-    # ------------------------------------------------------------------------ #
-    # Initialize log files
-    _statfile = open(RESFOLDER+"inspyred-statistics-"+runstring+".txt","a")
-    _indfile = open(RESFOLDER+"inspyred-individuals-"+runstring+".txt","a")
+def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size, display=False, runstring="", mode=default_mode, num_workers=default_num_workers, worker_type=default_worker_type, warm_start_directory=None, stall_generations=stallGenerations, noise_aware_elitism=noiseAwareElitism):
+    # The confidence intervals are computed only when they are used
+    aubioparameters = create_aubioparameters(onset_method, buffer_size, bootstrapmetrics.NUM_RESAMPLES if noise_aware_elitism else 0)
+    # Create an instance of the problem and feed the current pseudo-random
+    # generator
+    problem = ConfigurationEvaluator(rng,aubioparameters)
+    # Worker processes: forked from a fork server that has already imported
+    # this script and the evaluation modules (the audio is not preloaded,
+    # aubioonset reads it). The evaluation threads only wait for them.
+    if worker_type == "processes":
+        problem.pool = workerpool.create_pool(num_workers, aubioparameters['audio_directory'], preload_audio=False)
+
+    # - INSPYRED INITIALIZATION ---------------------------------------------- #
+
+    # the evolutionary algorithm (EvolutionaryComputation is a fully
+    # configurable evolutionary algorithm)
+    # standard GA, ES, SA, DE, EDA, PAES, NSGA2, PSO and ACO are also available
+    ea = inspyred.ec.EvolutionaryComputation(rng)
 
+    # observers: provide various logging features
+    # The telemetry observer appends per-generation statistics to a JSON-lines
+    # stream, the plot is rendered from it once at the end of the run
+    telemetry_observer = telemetry.TelemetryObserver(RESFOLDER+"telemetry-"+runstring+".jsonl")
+    ea.observer = [#inspyred.ec.observers.stats_observer,
+                   #inspyred.ec.observers.file_observer,
+                   #inspyred.ec.observers.plot_observer,
+                   telemetry_observer
+                    #inspyred.ec.observers.best_observer,
+                    #inspyred.ec.observers.population_observer
+                  ]
+
+    configure_operators(ea)
+
+    # Warm start: part of the initial population is seeded with the best
+    # solutions of previous runs (adjacent buffer sizes and other methods)
+    seeds = []
+    if warm_start_directory is not None:
+        priors = warmstart.load_prior_results(warm_start_directory)
+        seeds = warmstart.warm_start_seeds(priors, aubioparameters['real_onset_method'], buffer_size, int(populationSize*warmStartFraction))
+        print("Warm start with "+str(len(seeds))+" seeds from \""+warm_start_directory+"\"")
+    # Early stopping when the best fitness stalls
+    if stall_generations > 0:
+        ea.terminator = warmstart.stall_termination
+    # Elites chosen by the lower confidence bound of their fitness
+    if noise_aware_elitism:
+        ea.replacer = bootstrapmetrics.noise_aware_replacement
+        if mode == "async":
+            print("Noise-aware elitism is not used by the steady-state mode (only for the final choice)")
+
+    # ------------------------------------------------------------------------ #
     # Parameters for multiprocessing (CURRENTLY NOT WORKING)
     # https://pythonhosted.org/inspyred/examples.html#evaluating-individuals-concurrently
     #
@@ -281,15 +362,44 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
                               gaussian_stdev=gaussianStdev,
                               crossover_rate=crossoverRate,
                               num_selected=selectionSize,
-                              num_elites=numElites,
-                              statistics_file = _statfile,
-                              individuals_file =_indfile)
+                              num_elites=numElites)
+    elif mode == "async":
+        # Asynchronous steady-state evolution: each worker gets a new offspring
+        # as soon as it returns a fitness (no generation barrier)
+        final_pop, worker_stats = steadystate.evolve(ea,
+                                                     generator=problem.generator,
+                                                     evaluate=problem.evaluate,
+                                                     pop_size=populationSize,
+                                                     max_evaluations=numberOfEvaluations,
+                                                     num_workers=num_workers,
+                                                     bounder=problem.bounder,
+                                                     maximize=problem.maximize,
+                                                     seeds=seeds,
+                                                     terminator=warmstart.stall_termination if stall_generations > 0 else None,
+                                                     max_generations=numberOfGenerations,
+                                                     stall_generations=stall_generations,
+                                                     stall_tolerance=stallTolerance,
+                                                     tournament_size=tournamentSize,
+                                                     mutation_rate=mutationRate,
+                                                     gaussian_mean=gaussianMean,
+                                                     gaussian_stdev=gaussianStdev,
+                                                     crossover_rate=crossoverRate)
     else:
-        # Standard single-thread optimizer (WORKING)
+        # Standard generational optimizer, optionally evaluating each
+        # generation concurrently
+        if num_workers > 1:
+            concurrent_evaluator = steadystate.ConcurrentEvaluator(problem.evaluate, num_workers)
+            evaluator = concurrent_evaluator.evaluator
+        else:
+            evaluator = problem.evaluator
+        start_time = time.perf_counter()
         final_pop = ea.evolve(generator=problem.generator,
-                              evaluator=problem.evaluator,
+                              evaluator=evaluator,
                               bounder=problem.bounder,
                               maximize=problem.maximize,
+                              seeds=seeds,
+                              stall_generations=stall_generations,
+                              stall_tolerance=stallTolerance,
                               pop_size=populationSize,
                               max_generations=numberOfGenerations,
                               max_evaluations=numberOfEvaluations,
@@ -300,14 +410,30 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
                               crossover_rate=crossoverRate,
                               num_selected=selectionSize,
                               num_elites=numElites,
-                              statistics_file = _statfile,
-                              individuals_file =_indfile)
-
-    _statfile.close()
-    _indfile.close()
+                              fitness_intervals=problem.intervals)
+        if num_workers > 1:
+            worker_stats = concurrent_evaluator.statistics()
+            concurrent_evaluator.shutdown()
+        else:
+            # With a single worker, the worker is always busy
+            wall_time = time.perf_counter() - start_time
+            worker_stats = steadystate.worker_statistics(ea.num_evaluations, wall_time, wall_time, 1)
+
+    if not PARALLEL:
+        print("("+mode+") "+steadystate.format_worker_statistics(worker_stats))
+        logfile = open(RESFOLDER+"workers-"+runstring+".txt","w")
+        logfile.write(mode+"\t"+steadystate.format_worker_statistics(worker_stats)+"\n")
+        logfile.close()
+
+    telemetry_observer.close()
+    if problem.pool is not None:
+        problem.pool.shutdown()
 
     if display:
-        final_pop.sort(reverse=True)
+        if noise_aware_elitism:
+            final_pop.sort(key=lambda individual: bootstrapmetrics.lower_bound(individual, problem.intervals), reverse=True)
+        else:
+            final_pop.sort(reverse=True)
         print(final_pop[0])
         best_onset_threshold = final_pop[0].candidate[0]
         best_silence_threshold = final_pop[0].candidate[1]
@@ -331,7 +457,9 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
         res = computeLatency.create_string(info = info,
                                            metrics = metrics,
                                            use_oldformat=False,
-                                           do_copy = True,
+                                           do_copy = False,     # Off on purpose: batch runs are often
+                                                                # headless (no clipboard), the string
+                                                                # is printed and saved below
                                            failsafe = True)
         print(res) # Print the metrics
         # Write the metrics to file
@@ -339,20 +467,34 @@ def main(rng, onset_method=default_onset_method, buffer_size=default_buffer_size
         resfile.write(res+"\n")
         resfile.close()
 
-# Usage: evolutionaryOptimizer <random seed> <onset_method> <buffer_size>
+# Usage: evolutionaryOptimizer <random seed> <onset_method> <buffer_size> [--mode generational|async] [--workers N]
+#                              [--worker-type threads|processes]
+#                              [--warm-start [RESULTS_DIR]] [--stall-generations N]
+#                              [--noise-aware-elitism]
 if __name__ == "__main__":
-    if len(sys.argv) == 4 :
-        rng = Random(int(sys.argv[1]))
-        _method = sys.argv[2]
-        _bufsize = int(sys.argv[3])
-    else:
-        print("Error! Wrong number of arguments")
-        print("Usage: "+sys.argv[0]+" <seed> <onset_method> <buffer_size>")
-        exit()
+    parser = argparse.ArgumentParser(description="Evolutionary optimizer for the aubioonset parameters")
+    parser.add_argument("seed", type=int, help="Seed for the pseudo-random generator")
+    parser.add_argument("onset_method", help="Aubio onset method (or mkl(noaw))")
+    parser.add_argument("buffer_size", type=int, help="Aubio buffer size (samples)")
+    parser.add_argument("--mode", choices=["generational","async"], default=default_mode,
+                        help="Generational EA or asynchronous steady-state EA")
+    parser.add_argument("--workers", type=int, default=default_num_workers,
+                        help="Number of concurrent evaluations")
+    parser.add_argument("--worker-type", choices=["threads","processes"], default=default_worker_type,
+                        help="Evaluate in threads of this process or in preloaded worker processes (workerpool.py)")
+    parser.add_argument("--warm-start", nargs="?", const=RESFOLDER, default=None, metavar="RESULTS_DIR",
+                        help="Seed the initial population with previous best-*res.txt results (default dir: "+RESFOLDER+")")
+    parser.add_argument("--stall-generations", type=int, default=stallGenerations,
+                        help="Stop after this many generations without improvement (0: disabled)")
+    parser.add_argument("--noise-aware-elitism", action="store_true", default=noiseAwareElitism,
+                        help="Keep the elites with the best lower bound of the fitness confidence interval (generational mode)")
+    cli_args = parser.parse_args()
+    rng = Random(cli_args.seed)
+    _method = cli_args.onset_method
+    _bufsize = cli_args.buffer_size
 
     os.system("mkdir -p "+RESFOLDER)
 
-    import time
     # Create a string with the time of this execution (to avoid file overwrite)
     runstring = str(_method)+"-"+str(_bufsize)+"-"+time.strftime("%Y%m%d-%H%M%S")
 
@@ -367,10 +509,11 @@ if __name__ == "__main__":
     logger.addHandler(file_handler)
 
     # Call the main method
-    main(rng,onset_method=_method, buffer_size=_bufsize,display=display, runstring=runstring)
+    main(rng,onset_method=_method, buffer_size=_bufsize,display=display, runstring=runstring, mode=cli_args.mode, num_workers=cli_args.workers, worker_type=cli_args.worker_type,
+         warm_start_directory=cli_args.warm_start, stall_generations=cli_args.stall_generations,
+         noise_aware_elitism=cli_args.noise_aware_elitism)
 
     # Save the resuting plot
     if display:
-        pylab.ioff()
         print(runstring)
-        pylab.savefig(RESFOLDER+runstring)
+        telemetry.render_plot(RESFOLDER+"telemetry-"+runstring+".jsonl", RESFOLDER+runstring+".png")
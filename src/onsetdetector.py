@@ -0,0 +1,88 @@
+#! /usr/bin/python3
+#
+#  STREAMING ONSET DETECTOR
+#
+# In-process counterpart of "utility_scripts/extractOnset.sh": it runs the
+# aubio onset detector (python bindings) on a stream of audio blocks of any
+# length, keeping the detector state between blocks.
+# Reported onset times are DETECTION times: like perform_main_analysis in
+# "computeLatency.py", the delay that aubio subtracts from the detection time is
+# added back.
+#
+# A configuration can be loaded from the results of the optimizer
+# ("evolutionaryOptimizerResults/best-<method>-<buffer>res.txt").
+
+import aubio
+import computeLatency
+import numpy as np
+import os
+
+SAMPLERATE = 48000
+
+## Read a configuration from a results file of the optimizer
+#  (or any line created by computeLatency.create_string)
+#
+#  @param results_filename : Path of a "best-<method>-<buffer>res.txt" file
+#
+#  @return A dict with the parameters for OnsetDetector
+#
+def read_configuration(results_filename):
+    with open(results_filename, "r") as resfile:
+        fields = resfile.readline().split("\t")
+    configuration = {"onset_method":fields[0],
+                     "buffer_size":int(fields[1]),
+                     "hop_size":int(fields[2]),
+                     "minimum_inter_onset_interval_s":float(fields[3]),
+                     "silence_threshold":float(fields[4]),
+                     "onset_threshold":float(fields[5]),
+                     "disable_whitening":False}
+    # mkl without adaptive whitening is saved as "mkl" in the file, but the
+    # filename contains the real method name
+    if "(noaw)" in os.path.basename(results_filename) or configuration["onset_method"] == "mkl(noaw)":
+        configuration["onset_method"] = "mkl"
+        configuration["disable_whitening"] = True
+    return configuration
+
+## Aubio onset detector that processes blocks of arbitrary length
+class OnsetDetector():
+    def __init__(self, onset_method, buffer_size, hop_size, silence_threshold, onset_threshold, minimum_inter_onset_interval_s, samplerate=SAMPLERATE, disable_whitening=False):
+        self.hop_size = hop_size
+        self.samplerate = samplerate
+        self.onset = aubio.onset(onset_method, buffer_size, hop_size, samplerate)
+        self.onset.set_threshold(onset_threshold)
+        self.onset.set_silence(silence_threshold)
+        self.onset.set_minioi_s(minimum_inter_onset_interval_s)
+        if disable_whitening:
+            self.onset.set_awhitening(False)
+        # Same delay compensation as computeLatency.perform_main_analysis
+        self.delay_s = computeLatency.aubio_delay_samples(onset_method, hop_size) * 1.0 / samplerate
+        self.leftover = np.zeros(0, dtype=np.float32) # Samples not yet processed
+        self.processed_samples = 0
+
+    ## Process a block of samples
+    #
+    #  @param samples : float32 mono samples (any length)
+    #
+    #  @return A list with the detection times (s, from the stream start) of
+    #          the onsets found in this block
+    #
+    def process(self, samples):
+        if len(self.leftover) > 0:
+            samples = np.concatenate((self.leftover, samples))
+        onsets = []
+        num_hops = len(samples) // self.hop_size
+        for i in range(num_hops):
+            hop = samples[i*self.hop_size:(i+1)*self.hop_size]
+            if self.onset(hop):
+                onsets.append(self.onset.get_last_s() + self.delay_s)
+        self.leftover = np.array(samples[num_hops*self.hop_size:], dtype=np.float32)
+        self.processed_samples += num_hops*self.hop_size
+        return onsets
+
+    ## Process the remaining samples, zero-padded to a full hop
+    #  (as aubio does with the last block of a file)
+    def flush(self):
+        if len(self.leftover) == 0:
+            return []
+        padding = np.zeros(self.hop_size - len(self.leftover), dtype=np.float32)
+        return self.process(padding)
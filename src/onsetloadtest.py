@@ -0,0 +1,134 @@
+#! /usr/bin/python3
+#
+#  LOAD GENERATOR FOR THE ONSET DETECTION SERVICE
+#
+# It replays the recordings in "audiofiles/" to "onsetservice.py" over N
+# concurrent connections (one stream, i.e. one connection, per recording) and
+# reports throughput and response latency percentiles.
+# The latency of a block is the time between sending the block and receiving
+# the reply with its onsets.
+#
+# Usage: onsetloadtest.py [--connections N] [--block-size S] [--realtime]
+#                         [--host H] [--port P] [--unix PATH] [--audio-directory D]
+
+import argparse
+import asyncio
+import audioio
+import glob
+import json
+import numpy as np
+import struct
+import time
+
+FRAME_HEADER = struct.Struct("<I")
+
+## Stream one recording on a new connection
+#
+#  @param open_connection : Coroutine function that opens a connection
+#  @param samples         : float32 mono samples of the recording
+#  @param block_size      : Samples per block
+#  @param realtime        : Send blocks at the pace of the audio if True
+#  @param samplerate      : Samplerate (used for pacing only)
+#
+#  @return A list with the latency of each block (s) and the number of onsets
+#
+async def stream_recording(open_connection, samples, block_size, realtime, samplerate):
+    reader, writer = await open_connection()
+    await reader.readline()     # Configuration sent by the server
+    latencies = []
+    num_onsets = 0
+    start = time.perf_counter()
+    blocks = [samples[i:i+block_size] for i in range(0, len(samples), block_size)] + [None]
+    for index, block in enumerate(blocks):
+        if realtime and block is not None:
+            delay = start + index*block_size/samplerate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        payload = b"" if block is None else block.astype("<f4").tobytes()
+        sent = time.perf_counter()
+        writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - sent)
+        if "error" in reply:
+            raise Exception("Server error: "+reply["error"])
+        num_onsets += len(reply["onsets"])
+    writer.close()
+    return latencies, num_onsets
+
+## Replay a set of recordings over concurrent connections
+#
+#  @param recordings      : List of float32 arrays
+#  @param num_connections : Number of concurrent connections
+#
+#  @return A dict with the load test results
+#
+async def run_load_test(open_connection, recordings, num_connections, block_size, realtime, samplerate):
+    queue = asyncio.Queue()
+    for samples in recordings:
+        queue.put_nowait(samples)
+    latencies = []
+    num_onsets = 0
+
+    async def connection_worker():
+        nonlocal num_onsets
+        while not queue.empty():
+            samples = queue.get_nowait()
+            stream_latencies, stream_onsets = await stream_recording(open_connection, samples, block_size, realtime, samplerate)
+            latencies.extend(stream_latencies)
+            num_onsets += stream_onsets
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connection_worker() for _ in range(num_connections)])
+    wall_time = time.perf_counter() - start
+
+    audio_seconds = sum(len(samples) for samples in recordings) / samplerate
+    latencies_ms = np.array(latencies) * 1000.0
+    return {"connections":num_connections,
+            "streams":len(recordings),
+            "blocks":len(latencies),
+            "onsets":num_onsets,
+            "wall_time_s":wall_time,
+            "blocks_per_s":len(latencies)/wall_time,
+            "realtime_factor":audio_seconds/wall_time,
+            "latency_ms":{"p50":float(np.percentile(latencies_ms, 50)),
+                          "p90":float(np.percentile(latencies_ms, 90)),
+                          "p99":float(np.percentile(latencies_ms, 99)),
+                          "p99.9":float(np.percentile(latencies_ms, 99.9)),
+                          "max":float(latencies_ms.max())}}
+
+def format_results(results):
+    string = "Connections: {:d}  Streams: {:d}  Blocks: {:d}  Onsets: {:d}\n".format(
+              results["connections"], results["streams"], results["blocks"], results["onsets"])
+    string += "Wall time: {:.2f}s  Throughput: {:.0f} blocks/s  ({:.1f}x realtime)\n".format(
+              results["wall_time_s"], results["blocks_per_s"], results["realtime_factor"])
+    string += "Response latency (ms): " + "  ".join(key+": {:.3f}".format(value) for key, value in results["latency_ms"].items())
+    return string
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for onsetservice.py")
+    parser.add_argument("--connections", type=int, default=8, help="Concurrent connections")
+    parser.add_argument("--block-size", type=int, default=64, help="Samples per block")
+    parser.add_argument("--realtime", action="store_true", help="Send the audio at real time pace")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--unix", default=None, help="Connect to a Unix socket instead of TCP")
+    parser.add_argument("--audio-directory", default="audiofiles")
+    cli_args = parser.parse_args()
+
+    recordings = []
+    samplerate = None
+    for filename in sorted(glob.glob(cli_args.audio_directory+"/*.wav")):
+        samples, samplerate = audioio.read_wav(filename)
+        recordings.append(samples)
+    if len(recordings) == 0:
+        print("No wav file in "+cli_args.audio_directory)
+        exit()
+
+    if cli_args.unix is not None:
+        open_connection = lambda: asyncio.open_unix_connection(cli_args.unix)
+    else:
+        open_connection = lambda: asyncio.open_connection(cli_args.host, cli_args.port)
+
+    results = asyncio.run(run_load_test(open_connection, recordings, cli_args.connections, cli_args.block_size, cli_args.realtime, samplerate))
+    print(format_results(results))
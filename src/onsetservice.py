@@ -0,0 +1,138 @@
+#! /usr/bin/python3
+#
+#  LOCAL ONSET DETECTION SERVICE
+#
+# This service serves a configuration chosen by the optimizer
+# ("evolutionaryOptimizerResults/best-<method>-<buffer>res.txt") to many
+# clients, over TCP or a Unix socket (asyncio).
+# Each connection has its own detector state.
+# Blocks longer than a few hops are processed in a pool of threads, so the
+# event loop keeps serving the other connections while a long block is
+# processed (short blocks are processed directly: handing them to a thread
+# costs more than processing them). To use more cores, TCP
+# connections can be sharded across processes ("--processes N", the kernel
+# distributes the connections among them with SO_REUSEPORT).
+#
+# Protocol:
+# - On connection the server sends one JSON line with the configuration,
+#   the samplerate and the hop size expected
+# - The client sends blocks of audio, each one as a frame:
+#     <uint32 little-endian payload length in bytes><float32 little-endian PCM>
+#   (mono, at the samplerate of the configuration, blocks of any length)
+# - For each block the server replies with one JSON line:
+#     {"block": <block index>, "onsets": [<detection times in s>]}
+#   Times are relative to the beginning of the stream and include the same
+#   delay compensation used by computeLatency.perform_main_analysis
+# - A frame with length 0 ends the stream: the server processes the remaining
+#   samples, replies with the last onsets and closes the connection
+#
+# Usage: onsetservice.py <results_file> [--host H] [--port P] [--unix PATH]
+#                        [--threads N] [--processes N] [--inline-samples N]
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import numpy as np
+import onsetdetector
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+FRAME_HEADER = struct.Struct("<I")
+DEFAULT_THREADS = 4     # Detection threads per process
+INLINE_SAMPLES = 1024   # Longer blocks are processed in the thread pool
+
+## Serve one client connection
+#
+#  @param configuration : Dict of parameters for onsetdetector.OnsetDetector
+#  @param executor      : Executor that runs the detector (None: default one)
+#  @param inline_samples: Blocks up to this length run on the event loop
+#
+#  NOTE: the blocks of a connection are processed one at a time (each call is
+#        awaited), so its detector state is never used concurrently.
+#
+async def handle_connection(configuration, reader, writer, executor=None, inline_samples=INLINE_SAMPLES):
+    loop = asyncio.get_running_loop()
+    detector = onsetdetector.OnsetDetector(**configuration)
+    hello = {"configuration":configuration, "samplerate":detector.samplerate, "hop_size":detector.hop_size}
+    writer.write((json.dumps(hello)+"\n").encode())
+    block_index = 0
+    try:
+        while True:
+            header = await reader.readexactly(FRAME_HEADER.size)
+            (length,) = FRAME_HEADER.unpack(header)
+            if length == 0:
+                onsets = await loop.run_in_executor(executor, detector.flush)
+            else:
+                if length % 4 != 0:
+                    raise ValueError("Block length ("+str(length)+" bytes) is not a multiple of 4")
+                payload = await reader.readexactly(length)
+                samples = np.frombuffer(payload, dtype="<f4")
+                if len(samples) <= inline_samples:
+                    onsets = detector.process(samples)
+                else:
+                    onsets = await loop.run_in_executor(executor, detector.process, samples)
+            writer.write((json.dumps({"block":block_index, "onsets":onsets})+"\n").encode())
+            await writer.drain()
+            block_index += 1
+            if length == 0:
+                break
+    except asyncio.IncompleteReadError:
+        pass    # Client disconnected
+    except ValueError as error:
+        writer.write((json.dumps({"error":str(error)})+"\n").encode())
+    finally:
+        writer.close()
+
+## Start the service
+#
+#  @param results_filename : Configuration to serve (optimizer results file)
+#  @param host, port       : TCP address (used if unix_path is None)
+#  @param unix_path        : Path of a Unix socket
+#  @param num_threads      : Threads that run the detectors
+#  @param reuse_port       : Share the TCP port with other processes
+#  @param inline_samples   : Blocks up to this length run on the event loop
+#
+async def serve(results_filename, host="127.0.0.1", port=5555, unix_path=None, num_threads=DEFAULT_THREADS, reuse_port=False, inline_samples=INLINE_SAMPLES):
+    configuration = onsetdetector.read_configuration(results_filename)
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    handler = lambda reader, writer: handle_connection(configuration, reader, writer, executor, inline_samples)
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+        print("Serving "+results_filename+" on "+unix_path)
+    else:
+        server = await asyncio.start_server(handler, host=host, port=port, reuse_port=reuse_port)
+        print("Serving "+results_filename+" on "+host+":"+str(port))
+    print(configuration)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+## Run the service until interrupted (also the target of the shard processes)
+def run_server(*args):
+    try:
+        asyncio.run(serve(*args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local onset detection service")
+    parser.add_argument("results_file", help="Optimizer results file (best-<method>-<buffer>res.txt)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--unix", default=None, help="Serve on a Unix socket instead of TCP")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="Detection threads per process")
+    parser.add_argument("--processes", type=int, default=1, help="Processes sharing the TCP port (not with --unix)")
+    parser.add_argument("--inline-samples", type=int, default=INLINE_SAMPLES, help="Blocks up to this length are not handed to the threads (0: all blocks are)")
+    cli_args = parser.parse_args()
+    if cli_args.processes > 1 and cli_args.unix is not None:
+        parser.error("--processes requires TCP")
+    arguments = (cli_args.results_file, cli_args.host, cli_args.port, cli_args.unix, cli_args.threads, cli_args.processes > 1, cli_args.inline_samples)
+    shards = [multiprocessing.Process(target=run_server, args=arguments) for _ in range(cli_args.processes-1)]
+    for shard in shards:
+        shard.start()
+    run_server(*arguments)
+    for shard in shards:
+        shard.join()
@@ -0,0 +1,88 @@
+#! /usr/bin/python3
+#
+#  WORKER STARTUP BENCHMARK
+#
+# It compares the time to the first evaluation of a configuration, with the
+# same analysis that the optimizer runs (evolutionaryoptimizer.analyze_candidate),
+# for:
+# - cold: a new python interpreter that imports the optimizer and evaluates
+#         (what every "python3 evolutionaryoptimizer.py" run, e.g. each run of
+#         "run_all_eas.sh", or per-task worker process pays)
+# - warm: a new worker of the pool used by "evolutionaryoptimizer.py
+#         --worker-type processes", forked from the preloaded fork server of
+#         "workerpool.py" (modules imported and label index read once)
+# Both are measured from the request to the result, as seen by the caller.
+# "ready" times are measured with a no-op task instead of an evaluation.
+#
+# Usage: startupbenchmark.py <results_file> [--repeats N]
+
+import argparse
+import evolutionaryoptimizer
+import json
+import onsetdetector
+import statistics
+import subprocess
+import sys
+import time
+import workerpool
+
+COLD_CODE = """
+import sys, json
+import evolutionaryoptimizer    # Imports of an optimizer run
+if sys.argv[3] == "evaluate":
+    evolutionaryoptimizer.analyze_candidate(json.loads(sys.argv[1]), json.loads(sys.argv[2]))
+print("done", flush=True)
+"""
+
+def _noop():
+    return None
+
+## Time from the launch of a new interpreter to its first result
+def cold_start(aubioparameters, candidate, task):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", COLD_CODE, json.dumps(aubioparameters), json.dumps(candidate), task],
+                               stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.wait()
+    return elapsed
+
+## Time from the creation of a pool (warm fork server) to its first result
+def warm_start(aubioparameters, candidate, task):
+    start = time.perf_counter()
+    pool = workerpool.create_pool(1, aubioparameters['audio_directory'], preload_audio=False)
+    if task == "evaluate":
+        pool.submit(evolutionaryoptimizer.analyze_candidate, aubioparameters, candidate).result()
+    else:
+        pool.submit(_noop).result()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed
+
+def describe(times):
+    return "median {:.3f}s  min {:.3f}s  max {:.3f}s".format(statistics.median(times), min(times), max(times))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold vs warm worker time-to-first-evaluation")
+    parser.add_argument("results_file", help="Configuration to evaluate (best-<method>-<buffer>res.txt)")
+    parser.add_argument("--repeats", type=int, default=5)
+    cli_args = parser.parse_args()
+    configuration = onsetdetector.read_configuration(cli_args.results_file)
+    onset_method = "mkl(noaw)" if configuration["disable_whitening"] else configuration["onset_method"]
+    aubioparameters = evolutionaryoptimizer.create_aubioparameters(onset_method, configuration["buffer_size"])
+    candidate = [configuration["onset_threshold"], configuration["silence_threshold"]]
+
+    # Start the fork server once (this is paid once per optimizer run)
+    start = time.perf_counter()
+    pool = workerpool.create_pool(1, aubioparameters['audio_directory'], preload_audio=False)
+    pool.submit(_noop).result()
+    pool.shutdown()
+    print("Fork server startup (once): {:.3f}s".format(time.perf_counter() - start))
+
+    for task in ["ready", "evaluate"]:
+        cold = [cold_start(aubioparameters, candidate, task) for _ in range(cli_args.repeats)]
+        warm = [warm_start(aubioparameters, candidate, task) for _ in range(cli_args.repeats)]
+        label = "time to ready worker" if task == "ready" else "time to first evaluation"
+        print("Cold "+label+": "+describe(cold))
+        print("Warm "+label+": "+describe(warm))
+        print("Speedup (median): {:.1f}x".format(statistics.median(cold)/statistics.median(warm)))
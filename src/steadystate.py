@@ -0,0 +1,189 @@
+#! /usr/bin/python3
+#
+#  ASYNCHRONOUS STEADY-STATE EVOLUTION
+#
+# The generational replacement used by "evolutionaryoptimizer.py" evaluates a
+# whole generation and waits for the slowest candidate before breeding the next
+# one. Extraction time depends heavily on the thresholds (low thresholds produce
+# many more onsets to match), so with concurrent evaluation most workers sit
+# idle at every generation barrier.
+#
+# This module implements an asynchronous steady-state variant:
+# - Each worker is handed a new offspring as soon as it returns a fitness
+# - Replacement happens one individual at a time (an offspring replaces the
+#   worst individual of the population, only if it is better than it)
+# - Parents are chosen with the same selector and variated with the same
+#   variators configured on the inspyred EvolutionaryComputation object
+#
+# Evaluations run in threads: every evaluation spends its time in external
+# processes (aubioonset, Rscript) so threads are enough to keep all the cores
+# busy, and they avoid the pickling problems met with the multiprocessing
+# evaluator of inspyred.
+
+import inspyred
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+## Evaluate a single candidate and measure how long the worker was busy
+#
+#  @param evaluate  : Function that takes a candidate and returns its fitness
+#  @param candidate : Candidate solution (list of parameter values)
+#
+#  @return A tuple (candidate, fitness, busy time in seconds)
+#
+def timed_evaluation(evaluate, candidate):
+    start = time.perf_counter()
+    fitness = evaluate(candidate)
+    return candidate, fitness, time.perf_counter() - start
+
+## Summarize the usage of a pool of workers
+#
+#  @param num_evaluations : Number of evaluations completed
+#  @param busy_time       : Sum of the time spent evaluating by all workers (s)
+#  @param wall_time       : Elapsed time (s)
+#  @param num_workers     : Number of workers in the pool
+#
+#  @return A dict with throughput (evaluations/s) and worker utilization (0-1)
+#
+def worker_statistics(num_evaluations, busy_time, wall_time, num_workers):
+    return {"evaluations":num_evaluations,
+            "workers":num_workers,
+            "wall_time_s":wall_time,
+            "busy_time_s":busy_time,
+            "throughput":num_evaluations/wall_time if wall_time > 0 else 0.0,
+            "utilization":busy_time/(wall_time*num_workers) if wall_time > 0 else 0.0}
+
+def format_worker_statistics(stats):
+    return "Evaluations: {:d}  Workers: {:d}  Wall time: {:.1f}s  Throughput: {:.3f} eval/s  Worker utilization: {:.1f}%".format(
+            stats["evaluations"], stats["workers"], stats["wall_time_s"], stats["throughput"], stats["utilization"]*100.0)
+
+## Concurrent evaluator for the standard generational EA
+#  It evaluates the candidates of a generation on a pool of threads and keeps
+#  track of the worker usage, so that generational and steady-state runs can be
+#  compared on the same number of workers.
+class ConcurrentEvaluator():
+    def __init__(self, evaluate, num_workers):
+        self.evaluate = evaluate       # Single candidate evaluation function
+        self.num_workers = num_workers
+        self.busy_time = 0.0
+        self.num_evaluations = 0
+        self.start_time = None
+        self.pool = ThreadPoolExecutor(max_workers=num_workers)
+
+    ## Evaluator method (inspyred signature)
+    def evaluator(self, candidates, args):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        results = list(self.pool.map(lambda c: timed_evaluation(self.evaluate, c), candidates))
+        self.busy_time += sum(busy for _, _, busy in results)
+        self.num_evaluations += len(results)
+        return [fitness for _, fitness, _ in results]
+
+    def statistics(self):
+        wall_time = time.perf_counter() - self.start_time if self.start_time else 0.0
+        return worker_statistics(self.num_evaluations, self.busy_time, wall_time, self.num_workers)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+## Call the observers configured on the EC object
+def _notify_observers(ec, population, num_generations, num_evaluations, args):
+    observers = ec.observer if isinstance(ec.observer, (list, tuple)) else [ec.observer]
+    for observer in observers:
+        observer(population=list(population), num_generations=num_generations,
+                 num_evaluations=num_evaluations, args=args)
+
+## Create offspring from the current population
+#  It uses the selector and the variators of the EC object, exactly as the
+#  generational EA does, but on a single pair of parents.
+def _breed(ec, population, args):
+    parents = ec.selector(random=ec._random, population=list(population), args=dict(args, num_selected=2))
+    offspring = [list(p.candidate) for p in parents]
+    variators = ec.variator if isinstance(ec.variator, (list, tuple)) else [ec.variator]
+    for variator in variators:
+        offspring = variator(random=ec._random, candidates=offspring, args=args)
+    return offspring
+
+## Run an asynchronous steady-state evolution
+#
+#  @param ec              : inspyred EvolutionaryComputation object (its
+#                           selector, variator and observer are used)
+#  @param generator       : Generator of random candidates (inspyred signature)
+#  @param evaluate        : Function that takes a candidate and returns fitness
+#  @param pop_size        : Population size
+#  @param max_evaluations : Evaluation budget
+#  @param num_workers     : Number of concurrent evaluations
+#  @param bounder         : Bounder for the variators (default: no bounds)
+#  @param maximize        : Whether the fitness is maximized
+#  @param seeds           : Optional candidates evaluated before random ones
+#  @param terminator      : Optional inspyred terminator, checked once every
+#                           pop_size evaluations (the budget is always enforced)
+#  @param args            : Additional keyword arguments for the operators
+#
+#  @return The final population (list of inspyred Individuals) and a dict with
+#          the worker statistics (throughput and utilization)
+#
+#  Observers are called once every pop_size evaluations, so that their output
+#  can be compared with the generations of the generational EA.
+#
+def evolve(ec, generator, evaluate, pop_size, max_evaluations, num_workers, bounder=None, maximize=True, seeds=None, terminator=None, **args):
+    args["_ec"] = ec
+    ec.bounder = bounder if bounder is not None else inspyred.ec.Bounder()
+    ec.maximize = maximize
+    ec.population = []
+    ec.num_evaluations = 0
+    ec.num_generations = 0
+
+    seeds = [list(s) for s in (seeds or [])]
+    offspring_queue = []   # Variators can produce more than one offspring
+    submitted = 0
+    busy_time = 0.0
+    terminated = False
+
+    def next_candidate():
+        if seeds:
+            return seeds.pop(0)
+        # Fill the population with random individuals first
+        if len(ec.population) + len(pending) < pop_size or len(ec.population) < 2:
+            return generator(random=ec._random, args=args)
+        if not offspring_queue:
+            offspring_queue.extend(_breed(ec, ec.population, args))
+        return offspring_queue.pop(0)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = set()
+        while submitted < max_evaluations and len(pending) < num_workers:
+            pending.add(pool.submit(timed_evaluation, evaluate, next_candidate()))
+            submitted += 1
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                candidate, fitness, busy = future.result()
+                busy_time += busy
+                ec.num_evaluations += 1
+
+                individual = inspyred.ec.Individual(candidate, maximize=maximize)
+                individual.fitness = fitness
+                # Steady-state replacement (one individual at a time)
+                if len(ec.population) < pop_size:
+                    ec.population.append(individual)
+                else:
+                    worst = min(ec.population)
+                    if individual > worst:
+                        ec.population[ec.population.index(worst)] = individual
+
+                if len(ec.population) == pop_size and ec.num_evaluations % pop_size == 0:
+                    _notify_observers(ec, ec.population, ec.num_generations, ec.num_evaluations, args)
+                    if terminator is not None and terminator(population=list(ec.population), num_generations=ec.num_generations,
+                                                             num_evaluations=ec.num_evaluations, args=args):
+                        terminated = True   # Let the pending evaluations finish
+                    ec.num_generations += 1
+
+                if submitted < max_evaluations and not terminated:
+                    pending.add(pool.submit(timed_evaluation, evaluate, next_candidate()))
+                    submitted += 1
+
+    stats = worker_statistics(ec.num_evaluations, busy_time, time.perf_counter() - start_time, num_workers)
+    return list(ec.population), stats
@@ -0,0 +1,100 @@
+#! /usr/bin/python3
+#
+#  LOW-OVERHEAD TELEMETRY FOR THE EVOLUTIONARY OPTIMIZER
+#
+# Inspyred's plot_observer redraws a matplotlib figure at every generation and
+# file_observer writes the whole population, even on headless batch nodes where
+# only the final plot is saved.
+# This observer appends a compact line of statistics per generation to a
+# JSON-lines stream (buffered writes), with:
+# - generation and number of evaluations
+# - best, mean, median and worst fitness
+# - diversity (maximum distance between two candidates, as in inspyred's
+#   diversity_termination)
+# - time spent since the previous generation (evaluation time)
+#
+# The plot is rendered once, at the end of the run or offline from the stream:
+#   python3 telemetry.py <stream.jsonl> [<output.png>]
+
+import json
+import math
+import statistics
+import sys
+import time
+
+## Observer that writes per-generation statistics to a JSON-lines stream
+class TelemetryObserver():
+    ## @param path        : Path of the stream (opened in append mode)
+    #  @param buffer_size : Size of the write buffer (bytes)
+    def __init__(self, path, buffer_size=65536):
+        self.path = path
+        self.stream = open(path, "a", buffering=buffer_size)
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.__name__ = "telemetry_observer"    # inspyred logs observer names
+
+    ## Observer method (inspyred signature)
+    def __call__(self, population, num_generations, num_evaluations, args):
+        now = time.perf_counter()
+        fitnesses = sorted(individual.fitness for individual in population)
+        candidates = [individual.candidate for individual in population]
+        record = {"generation":num_generations,
+                  "evaluations":num_evaluations,
+                  "best":max(fitnesses) if args["_ec"].maximize else min(fitnesses),
+                  "mean":sum(fitnesses)/len(fitnesses),
+                  "median":statistics.median(fitnesses),
+                  "worst":min(fitnesses) if args["_ec"].maximize else max(fitnesses),
+                  "diversity":diversity(candidates),
+                  "eval_time_s":round(now-self.last_time, 6),
+                  "elapsed_s":round(now-self.start_time, 6)}
+        self.stream.write(json.dumps(record, separators=(",",":"))+"\n")
+        self.last_time = now
+
+    def close(self):
+        self.stream.close()
+
+## Maximum euclidean distance between two candidates of the population
+def diversity(candidates):
+    result = 0.0
+    for i in range(len(candidates)):
+        for j in range(i+1, len(candidates)):
+            result = max(result, math.dist(candidates[i], candidates[j]))
+    return result
+
+## Read a telemetry stream
+#  @return A list of dicts, one per generation
+def read_stream(path):
+    with open(path, "r") as stream:
+        return [json.loads(line) for line in stream if line.strip() != ""]
+
+## Plot the fitness statistics of a telemetry stream
+#  Matplotlib is imported only here, so the optimizer does not pay for it
+#  during the evolution.
+#
+#  @param path        : Path of the telemetry stream
+#  @param output_path : Path of the image to save
+#
+def render_plot(path, output_path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    records = read_stream(path)
+    evaluations = [r["evaluations"] for r in records]
+    fig = plt.figure()
+    for key, color in [("mean","black"), ("median","blue"), ("best","green"), ("worst","red")]:
+        plt.plot(evaluations, [r[key] for r in records], color=color, label=key)
+    plt.legend(loc="lower right")
+    plt.xlabel("Evaluations")
+    plt.ylabel("Fitness")
+    fig.savefig(output_path)
+    plt.close(fig)
+
+# Usage: telemetry.py <stream.jsonl> [<output.png>]
+if __name__ == "__main__":
+    if len(sys.argv) not in [2, 3]:
+        print("Usage: "+sys.argv[0]+" <stream.jsonl> [<output.png>]")
+        exit()
+    output_path = sys.argv[2] if len(sys.argv) == 3 else sys.argv[1].rsplit(".",1)[0]+".png"
+    render_plot(sys.argv[1], output_path)
+    print("Plot saved to "+output_path)
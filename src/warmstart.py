@@ -0,0 +1,104 @@
+#! /usr/bin/python3
+#
+#  WARM START AND EARLY STOPPING FOR THE EVOLUTIONARY OPTIMIZER
+#
+# Every run of "evolutionaryoptimizer.py" starts from a uniform random
+# population, even when good thresholds for neighbouring configurations are
+# already known (evolutionaryOptimizerResults/best-<method>-<buffer>res.txt).
+#
+# - warm_start_seeds() picks the prior optima closest to the configuration
+#   being optimized: same method and adjacent buffer sizes first, then other
+#   methods with the same (or adjacent) buffer size. These seed part of the
+#   initial population, the rest is still random.
+# - stall_termination() is an inspyred terminator that stops the evolution
+#   when the best fitness stops improving (or at max_generations).
+
+import glob
+import math
+import os
+import re
+
+RESULTS_PATTERN = re.compile(r"best-(.+)-([0-9]+)res\.txt$")
+
+# Distance added between different onset methods, in "buffer size steps"
+# (a factor of 2 in buffer size is one step)
+METHOD_DISTANCE = 1.5
+
+## Read the best configurations found by previous runs
+#
+#  @param results_directory : Directory with the best-<method>-<buffer>res.txt
+#                             files written by the optimizer
+#
+#  @return A list of dicts (onset_method, buffer_size, onset_threshold,
+#          silence_threshold, fitness)
+#
+def load_prior_results(results_directory):
+    priors = []
+    for filename in sorted(glob.glob(os.path.join(results_directory, "best-*res.txt"))):
+        match = RESULTS_PATTERN.search(os.path.basename(filename))
+        if match is None:
+            continue
+        with open(filename, "r") as resfile:
+            fields = resfile.readline().split("\t")
+        try:
+            # See computeLatency.create_string for the field order
+            priors.append({"onset_method":match.group(1),   # Real method name, e.g. mkl(noaw)
+                           "buffer_size":int(match.group(2)),
+                           "silence_threshold":float(fields[4]),
+                           "onset_threshold":float(fields[5]),
+                           "fitness":float(fields[15])})     # Macro avg. (technique) f1-score
+        except (IndexError, ValueError):
+            print("Skipping malformed results file \""+filename+"\"")
+    return priors
+
+## Distance between a prior result and the configuration to optimize
+def configuration_distance(prior, onset_method, buffer_size):
+    distance = abs(math.log2(prior["buffer_size"]) - math.log2(buffer_size))
+    if prior["onset_method"] != onset_method:
+        distance += METHOD_DISTANCE
+    return distance
+
+## Choose the seeds for the initial population
+#
+#  @param priors         : Prior results (see load_prior_results)
+#  @param onset_method   : Method being optimized (e.g. "hfc", "mkl(noaw)")
+#  @param buffer_size    : Buffer size being optimized
+#  @param num_seeds      : Maximum number of seeds
+#  @param exclude_self   : Ignore the result of this exact configuration
+#
+#  @return A list of candidates ([onset_threshold, silence_threshold]), the
+#          closest configurations first
+#
+def warm_start_seeds(priors, onset_method, buffer_size, num_seeds, exclude_self=False):
+    if exclude_self:
+        priors = [p for p in priors if not (p["onset_method"] == onset_method and p["buffer_size"] == buffer_size)]
+    ranked = sorted(priors, key=lambda p: (configuration_distance(p, onset_method, buffer_size), -p["fitness"]))
+    seeds = []
+    for prior in ranked:
+        candidate = [prior["onset_threshold"], prior["silence_threshold"]]
+        if candidate not in seeds:
+            seeds.append(candidate)
+        if len(seeds) >= num_seeds:
+            break
+    return seeds
+
+## Terminator that stops when the best fitness stalls
+#  Optional keyword arguments in args:
+#  - max_generations   : stop anyway after these generations
+#  - stall_generations : generations without improvement before stopping
+#  - stall_tolerance   : minimum improvement of the best fitness
+def stall_termination(population, num_generations, num_evaluations, args):
+    max_generations = args.setdefault("max_generations", 30)
+    stall_generations = args.setdefault("stall_generations", 5)
+    stall_tolerance = args.setdefault("stall_tolerance", 0.0001)
+    best = max(population).fitness
+    if "stall_best_fitness" not in args:
+        improvement = math.inf
+    elif args["_ec"].maximize:
+        improvement = best - args["stall_best_fitness"]
+    else:
+        improvement = args["stall_best_fitness"] - best
+    if improvement > stall_tolerance:
+        args["stall_best_fitness"] = best
+        args["stall_generation"] = num_generations
+    return num_generations >= max_generations or num_generations - args["stall_generation"] >= stall_generations
@@ -0,0 +1,145 @@
+#! /usr/bin/python3
+#
+#  WARM START BENCHMARK
+#
+# For each combination of onset method and buffer size, this script runs the
+# optimizer twice with the same seed:
+# - cold: uniform random initial population, full number of generations
+# - warm: initial population seeded with the prior results of the OTHER
+#         configurations (adjacent buffer sizes and other methods, the result
+#         of the configuration itself is excluded) and early stopping
+# It reports how many evaluations each run needed to reach the best f1-score
+# found by the cold run, and the total number of evaluations performed.
+#
+# Usage: warmstartbenchmark.py <seed> [--results-directory DIR]
+#                              [--methods M ...] [--buffer-sizes B ...]
+#                              [--stall-generations N] [--workers N]
+
+import argparse
+import evolutionaryoptimizer as eo
+import inspyred
+import os
+import steadystate
+import threading
+import time
+import warmstart
+from random import Random
+
+METHODS = ["hfc","energy","complex","phase","specdiff","kl","mkl","specflux","mkl(noaw)"]
+BUFFER_SIZES = [64,128,256,512,1024,2048]
+
+## Records the fitness of every evaluation, in order of completion
+class EvaluationTrace():
+    def __init__(self, evaluate):
+        self.evaluate_function = evaluate
+        self.fitnesses = []
+        self.lock = threading.Lock()
+
+    def evaluate(self, candidate):
+        fitness = self.evaluate_function(candidate)
+        with self.lock:
+            self.fitnesses.append(fitness)
+        return fitness
+
+    def evaluator(self, candidates, args):
+        return [self.evaluate(candidate) for candidate in candidates]
+
+    def best(self):
+        return max(self.fitnesses)
+
+    ## Number of evaluations needed to reach @target (None if never reached)
+    def evaluations_to(self, target):
+        for index, fitness in enumerate(self.fitnesses):
+            if fitness >= target:
+                return index+1
+        return None
+
+## Run the generational EA of the optimizer without writing any result
+#
+#  @return The EvaluationTrace of the run
+#
+def run_optimizer(seed, onset_method, buffer_size, seeds, stall_generations, num_workers):
+    rng = Random(seed)
+    problem = eo.ConfigurationEvaluator(rng, eo.create_aubioparameters(onset_method, buffer_size))
+    trace = EvaluationTrace(problem.evaluate)
+    ea = inspyred.ec.EvolutionaryComputation(rng)
+    eo.configure_operators(ea)
+    if stall_generations > 0:
+        ea.terminator = warmstart.stall_termination
+    if num_workers > 1:
+        concurrent_evaluator = steadystate.ConcurrentEvaluator(trace.evaluate, num_workers)
+        evaluator = concurrent_evaluator.evaluator
+    else:
+        evaluator = trace.evaluator
+    ea.evolve(generator=problem.generator,
+              evaluator=evaluator,
+              bounder=problem.bounder,
+              maximize=problem.maximize,
+              seeds=seeds,
+              pop_size=eo.populationSize,
+              max_generations=eo.numberOfGenerations,
+              tournament_size=eo.tournamentSize,
+              mutation_rate=eo.mutationRate,
+              gaussian_mean=eo.gaussianMean,
+              gaussian_stdev=eo.gaussianStdev,
+              crossover_rate=eo.crossoverRate,
+              num_selected=eo.selectionSize,
+              num_elites=eo.numElites,
+              stall_generations=stall_generations,
+              stall_tolerance=eo.stallTolerance)
+    if num_workers > 1:
+        concurrent_evaluator.shutdown()
+    return trace
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluations saved by warm starting the optimizer")
+    parser.add_argument("seed", type=int)
+    parser.add_argument("--results-directory", default=eo.RESFOLDER, help="Directory with the prior best-*res.txt files")
+    parser.add_argument("--methods", nargs="+", default=METHODS)
+    parser.add_argument("--buffer-sizes", nargs="+", type=int, default=BUFFER_SIZES)
+    parser.add_argument("--stall-generations", type=int, default=5, help="Early stopping of the warm runs")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent evaluations")
+    cli_args = parser.parse_args()
+
+    priors = warmstart.load_prior_results(cli_args.results_directory)
+    print("Loaded "+str(len(priors))+" prior results from \""+cli_args.results_directory+"\"")
+    os.system("mkdir -p "+eo.RESFOLDER)
+    logfilename = eo.RESFOLDER+"warmstart-benchmark-"+time.strftime("%Y%m%d-%H%M%S")+".txt"
+    logfile = open(logfilename, "w")
+    header = "method\tbuffer\tcold_best_f1\twarm_best_f1\tcold_evals_to_target\twarm_evals_to_target\tcold_evals\twarm_evals"
+    print(header)
+    logfile.write(header+"\n")
+
+    totals = {"cold_to_target":0, "warm_to_target":0, "cold":0, "warm":0, "reached":0, "cells":0}
+    for method in cli_args.methods:
+        for buffer_size in cli_args.buffer_sizes:
+            seeds = warmstart.warm_start_seeds(priors, method, buffer_size, int(eo.populationSize*eo.warmStartFraction), exclude_self=True)
+            cold = run_optimizer(cli_args.seed, method, buffer_size, [], 0, cli_args.workers)
+            warm = run_optimizer(cli_args.seed, method, buffer_size, seeds, cli_args.stall_generations, cli_args.workers)
+            target = cold.best()
+            cold_to_target = cold.evaluations_to(target)
+            warm_to_target = warm.evaluations_to(target)
+            line = "\t".join([method, str(buffer_size), "{:.4f}".format(cold.best()), "{:.4f}".format(warm.best()),
+                              str(cold_to_target), str(warm_to_target) if warm_to_target else "not reached",
+                              str(len(cold.fitnesses)), str(len(warm.fitnesses))])
+            print(line)
+            logfile.write(line+"\n")
+            logfile.flush()
+
+            totals["cells"] += 1
+            totals["cold"] += len(cold.fitnesses)
+            totals["warm"] += len(warm.fitnesses)
+            if warm_to_target:
+                totals["reached"] += 1
+                totals["cold_to_target"] += cold_to_target
+                totals["warm_to_target"] += warm_to_target
+
+    summary = "Warm runs reached the cold f1-score in {:d}/{:d} configurations\n".format(totals["reached"], totals["cells"])
+    if totals["reached"] > 0:
+        summary += "Evaluations to target (where reached): cold {:d}, warm {:d} ({:.1f}% saved)\n".format(
+                    totals["cold_to_target"], totals["warm_to_target"], 100.0*(1.0-totals["warm_to_target"]/totals["cold_to_target"]))
+    summary += "Total evaluations: cold {:d}, warm {:d} ({:.1f}% saved)".format(
+                totals["cold"], totals["warm"], 100.0*(1.0-totals["warm"]/totals["cold"]))
+    print(summary)
+    logfile.write(summary+"\n")
+    logfile.close()
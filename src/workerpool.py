@@ -0,0 +1,104 @@
+#! /usr/bin/python3
+#
+#  WORKER POOL WITH PRELOADED FORKSERVER
+#
+# Every process that evaluates configurations pays for the imports of the
+# evaluation modules and for reading the dataset (label index and, for the
+# in-process backend, the audio files).
+# This pool uses the "forkserver" start method of multiprocessing: the fork
+# server imports the evaluation modules and loads the dataset ONCE, then every
+# worker is forked from that warm state.
+#
+# Two evaluation backends are available:
+# - "aubioonset": computeLatency.perform_main_analysis (aubioonset + R)
+# - "inprocess" : chunkedevaluation.evaluate_recordings on the preloaded audio
+#
+# Usage:
+#   pool = workerpool.create_pool(num_workers)
+#   future = pool.submit(workerpool.evaluate_configuration, configuration)
+#
+# The optimizer evaluates its solutions with this pool when it is run with
+# "--worker-type processes" (see evolutionaryoptimizer.analyze_candidate).
+# The fork server also imports the main script (e.g. the optimizer, with
+# inspyred and the other modules it imports), so workers do not import it again.
+
+import computeLatency
+import multiprocessing
+import multiprocessing.forkserver
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Modules imported by the fork server ("workerpoolpreload" loads the dataset,
+# "__main__" is the script that creates the pool)
+PRELOAD_MODULES = ["__main__", "computeLatency", "audioio", "onsetdetector", "chunkedevaluation", "dataset", "workerpool", "workerpoolpreload"]
+# The fork server inherits the environment of the process that starts it:
+# this variable tells it which dataset to load (only set while it starts)
+PRELOAD_ENVIRONMENT = "ONSET_WORKERPOOL_PRELOAD"
+
+AUBIOONSET_COMMAND = "aubioonset"
+AUBIOONSET_NOWHITENING_COMMAND = "./utility_scripts/customAubio/aubioonset-mkl-nowhitening"
+
+## Load the label index and (optionally) the audio of the dataset
+def warm_up(audio_directory="audiofiles", labels_directory="onsets_labeled", preload_audio=True):
+    computeLatency.load_label_index(labels_directory)
+    if preload_audio:
+        import dataset
+        dataset.load_dataset(audio_directory, labels_directory)
+
+## Create a pool of workers forked from a preloaded fork server
+#
+#  @param num_workers      : Number of worker processes
+#  @param audio_directory  : Directory containing audio files
+#  @param labels_directory : Directory containing the label files
+#  @param preload_audio    : Also load the audio files (inprocess backend)
+#
+#  @return A concurrent.futures.ProcessPoolExecutor
+#
+#  NOTE: the fork server is started once per process, by the first call, and it
+#        is shared by all the pools created later (with the same dataset).
+#
+def create_pool(num_workers, audio_directory="audiofiles", labels_directory="onsets_labeled", preload_audio=True):
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD_MODULES)
+    # Start the fork server with the variable set, then restore the
+    # environment so that other child processes do not inherit it
+    previous_value = os.environ.get(PRELOAD_ENVIRONMENT)
+    os.environ[PRELOAD_ENVIRONMENT] = os.pathsep.join([audio_directory, labels_directory, "1" if preload_audio else "0"])
+    try:
+        multiprocessing.forkserver.ensure_running()
+    finally:
+        if previous_value is None:
+            del os.environ[PRELOAD_ENVIRONMENT]
+        else:
+            os.environ[PRELOAD_ENVIRONMENT] = previous_value
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=context)
+
+## Evaluate a configuration (task executed by the workers)
+#
+#  @param configuration : Dict of parameters (see onsetdetector.read_configuration)
+#  @param backend       : "aubioonset" or "inprocess"
+#  @param bootstrap_resamples : Resamples for the confidence intervals
+#                               (0: not computed)
+#
+#  @return The metrics dict (as returned by perform_main_analysis)
+#
+def evaluate_configuration(configuration, backend="aubioonset", audio_directory="audiofiles", labels_directory="onsets_labeled", bootstrap_resamples=0):
+    if backend == "inprocess":
+        import chunkedevaluation
+        import dataset
+        return chunkedevaluation.evaluate_recordings(dataset.load_dataset(audio_directory, labels_directory), configuration,
+                                                     bootstrap_resamples=bootstrap_resamples)
+    elif backend == "aubioonset":
+        info, metrics = computeLatency.perform_main_analysis(audio_directory = audio_directory,
+                                                             aubioonset_command = AUBIOONSET_NOWHITENING_COMMAND if configuration["disable_whitening"] else AUBIOONSET_COMMAND,
+                                                             onset_method = configuration["onset_method"],
+                                                             buffer_size = configuration["buffer_size"],
+                                                             hop_size = configuration["hop_size"],
+                                                             silence_threshold = configuration["silence_threshold"],
+                                                             onset_threshold = configuration["onset_threshold"],
+                                                             minimum_inter_onset_interval_s = configuration["minimum_inter_onset_interval_s"],
+                                                             save_results = False,
+                                                             bootstrap_resamples = bootstrap_resamples)
+        return metrics
+    else:
+        raise Exception("Unknown evaluation backend \""+backend+"\"")
@@ -0,0 +1,17 @@
+#! /usr/bin/python3
+#
+#  WARM-UP OF THE WORKER POOL FORK SERVER
+#
+# This module is imported only by the fork server of "workerpool.py" (see
+# workerpool.PRELOAD_MODULES), and importing it is all it does: it loads the
+# dataset named by the environment variable that workerpool.create_pool sets
+# while the fork server starts. Workers forked from the server inherit the
+# loaded dataset.
+
+import os
+import workerpool
+
+_value = os.environ.get(workerpool.PRELOAD_ENVIRONMENT)
+if _value:
+    _audio_directory, _labels_directory, _preload_audio = _value.split(os.pathsep)
+    workerpool.warm_up(_audio_directory, _labels_directory, _preload_audio == "1")